@@ -12,34 +12,150 @@ You can use this service to get a unique booking reference. Make a GET request t
 This will return a string that looks a bit like this:
 
 	75bcd15
+
+To avoid one request per reservation, you can also lease a block of consecutive booking references with:
+
+    http://localhost:8082/booking_references?count=100
+
+This returns a json document like this:
+
+    {"references": ["75bcd16", "75bcd17"], "lease_seconds": 300}
+
+The references must not be used once the lease has expired.
+
+By default, the counter used to generate references lives in memory, and starts again from the same point after a restart. Start the server with `--state-file some/file` to make sure no reference is ever handed out twice: the highest reference that may have been handed out is saved in this file, a block at a time.
+
+To run several instances, start each one with `--node-count` set to the number of instances and a different `--node-id`: each instance then only hands out references whose value modulo the node count is its node id.
 """
 
+import argparse
 import cherrypy
-import itertools
+import json
+import os
+import threading
+
+
+# Maximum number of references in a block
+MAX_BLOCK_SIZE = 1000
+
+# How long leased references remain valid, in seconds
+LEASE_SECONDS = 300
+
+
+# Number of references reserved in the state file at a time
+RESERVED_BLOCK_SIZE = 1000
+
+
+class ReferenceGenerator(object):
+    """
+    Hands out increasing numbers, starting after `starting_point`, that
+    are equal to `node_id` modulo `node_count`.
+
+    When `state_path` is set, numbers are reserved in blocks in that
+    file before being handed out, and a new generator using the same file
+    starts after the last reserved number.
+
+    Thread safe
+    """
+
+    def __init__(self, starting_point, node_id=0, node_count=1, state_path=None):
+        if not 0 <= node_id < node_count:
+            raise ValueError("node id must be between 0 and node count - 1")
+        self.node_id = node_id
+        self.node_count = node_count
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self.last = starting_point
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.last = max(starting_point, int(f.read()))
+        # Numbers up to this one can be handed out without touching the
+        # state file
+        self._reserved = self.last
+
+    def _next_after(self, number):
+        return number + 1 + (self.node_id - number - 1) % self.node_count
+
+    def take(self, count=1):
+        with self._lock:
+            res = []
+            number = self.last
+            for _ in range(count):
+                number = self._next_after(number)
+                res.append(number)
+            if number > self._reserved:
+                self._reserve(number + RESERVED_BLOCK_SIZE * self.node_count)
+            self.last = number
+            return res
+
+    def _reserve(self, number):
+        if self.state_path:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(number))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+            # Otherwise, the rename may be lost after a crash, and the
+            # previous number read again on restart
+            self._sync_directory()
+        self._reserved = number
+
+    def _sync_directory(self):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def to_reference(number):
+    return str(hex(number))[2:]
 
 
 class BookingReferenceService(object):
-    def __init__(self, starting_point):
-        self.counter = starting_point
+    def __init__(self, starting_point, generator=None):
+        self.generator = generator or ReferenceGenerator(starting_point)
 
     def last_booking_reference(self):
-        return str(hex(self.counter))[2:]
+        return to_reference(self.generator.last)
 
     def booking_reference(self):
-        self.counter += 1
-        return str(hex(self.counter))[2:]
+        (number,) = self.generator.take()
+        return to_reference(number)
+
+    def booking_references(self, count):
+        count = max(1, min(int(count), MAX_BLOCK_SIZE))
+        references = [to_reference(n) for n in self.generator.take(count)]
+        return json.dumps({"references": references, "lease_seconds": LEASE_SECONDS})
 
     booking_reference.exposed = True
     last_booking_reference.exposed = True
+    booking_references.exposed = True
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--state-file", help="where to save the last reserved booking reference"
+    )
+    parser.add_argument("--node-id", type=int, default=0)
+    parser.add_argument("--node-count", type=int, default=1)
+    args = parser.parse_args()
+
     starting_point = 123456789
+    generator = ReferenceGenerator(
+        starting_point,
+        node_id=args.node_id,
+        node_count=args.node_count,
+        state_path=args.state_file,
+    )
     cherrypy.config.update(
         {"server.socket_port": 8082, "server.socket_host": "0.0.0.0"}
     )
 
-    cherrypy.quickstart(BookingReferenceService(starting_point))
+    cherrypy.quickstart(BookingReferenceService(starting_point, generator=generator))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+# Run with `python -m pytest` from the booking_reference directory
+
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from server import BookingReferenceService, ReferenceGenerator
+
+
+def test_booking_references_are_hex_and_increasing():
+    service = BookingReferenceService(123456789)
+
+    assert service.booking_reference() == "75bcd16"
+    assert service.booking_reference() == "75bcd17"
+    assert service.last_booking_reference() == "75bcd17"
+
+
+def test_blocks_of_booking_references():
+    service = BookingReferenceService(123456789)
+    service.booking_reference()
+
+    block = json.loads(service.booking_references("3"))
+
+    assert block["references"] == ["75bcd17", "75bcd18", "75bcd19"]
+    assert service.last_booking_reference() == "75bcd19"
+
+
+def test_concurrent_booking_references_are_unique():
+    service = BookingReferenceService(0)
+    references = []
+
+    def take():
+        for _ in range(1000):
+            references.append(service.booking_reference())
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(references)) == 8000
+
+
+def test_no_reference_is_handed_out_twice_after_a_restart(tmp_path):
+    state_path = str(tmp_path / "state")
+    generator = ReferenceGenerator(0, state_path=state_path)
+    before_restart = generator.take(5)
+
+    restarted = ReferenceGenerator(0, state_path=state_path)
+
+    assert restarted.take()[0] > max(before_restart)
+
+
+def test_state_file_and_its_directory_are_synced(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def record_fsync(fd):
+        synced.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", record_fsync)
+    generator = ReferenceGenerator(0, state_path=str(tmp_path / "state"))
+    generator.take()
+
+    assert synced == [False, True]
+
+
+def test_nodes_hand_out_different_references():
+    nodes = [ReferenceGenerator(0, node_id=i, node_count=3) for i in range(3)]
+
+    numbers = [n for node in nodes for n in node.take(100)]
+
+    assert len(set(numbers)) == 300
+    assert all(n % 3 == 0 for n in nodes[0].take(10))
+
+
+def test_invalid_node_id():
+    with pytest.raises(ValueError):
+        ReferenceGenerator(0, node_id=3, node_count=3)
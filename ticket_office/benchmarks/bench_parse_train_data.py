@@ -0,0 +1,75 @@
+"""
+Compare parse_train_data(), parse_train_bytes() and the compact encoding
+(wire_format.decode_train()) on trains of various sizes
+
+Run with:
+
+    python -m benchmarks.bench_parse_train_data
+
+Note: trains cannot have more than 26 coaches of 100 seats, so the biggest
+train has 2,600 seats
+"""
+
+import json
+import string
+import timeit
+from typing import Callable
+
+from ticket_office.domain.compact_train import CompactTrain
+from ticket_office.domain.reservation import TrainId
+from ticket_office.infra.http_client import parse_train_bytes, parse_train_data
+from ticket_office.infra.wire_format import decode_train, encode_train
+
+SIZES = [16, 1_000, 2_600]
+SEATS_PER_COACH = 100
+
+
+def make_train_data(seat_count: int) -> bytes:
+    """
+    Generate a body looking like the one returned by train_data,
+    with one seat out of three booked
+    """
+    seats = {}
+    for i in range(seat_count):
+        coach = string.ascii_uppercase[i // SEATS_PER_COACH]
+        number = i % SEATS_PER_COACH + 1
+        booking_reference = "75bcd15" if i % 3 == 0 else ""
+        seats[f"{number}{coach}"] = {
+            "coach": coach,
+            "seat_number": str(number),
+            "booking_reference": booking_reference,
+        }
+    return json.dumps({"seats": seats}).encode()
+
+
+def measure(function: Callable[[], object]) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=5, number=number))
+    return best / number
+
+
+def main() -> None:
+    train_id = TrainId("express_2000")
+    print(
+        f"{'seats':>6} {'json (µs)':>12} {'bytes (µs)':>12} {'speedup':>8}"
+        f" {'compact (µs)':>13} {'speedup':>8} {'size':>7} {'compact':>8}"
+    )
+    for seat_count in SIZES:
+        content = make_train_data(seat_count)
+        train = parse_train_bytes(train_id, content)
+        assert len(train.seats()) == seat_count
+        assert isinstance(train, CompactTrain)
+        compact = encode_train(train)
+        slow = measure(lambda: parse_train_data(train_id, json.loads(content)))
+        fast = measure(lambda: parse_train_bytes(train_id, content))
+        fastest = measure(lambda: decode_train(train_id, compact))
+        print(
+            f"{seat_count:>6} {slow * 1e6:>12.1f} {fast * 1e6:>12.1f} {slow / fast:>7.1f}x"
+            f" {fastest * 1e6:>13.1f} {slow / fastest:>7.1f}x"
+            f" {len(content):>7} {len(compact):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
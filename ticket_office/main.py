@@ -1,17 +1,107 @@
-import cherrypy
+import argparse
+import os
+from pathlib import Path
 
-from ticket_office.domain.ticket_office import TicketOffice
+from ticket_office.domain.batching import BatchingTicketOffice
+from ticket_office.domain.client import Client
+from ticket_office.domain.ticket_office import Reserver, TicketOffice
 from ticket_office.infra.http_client import HttpClient
-from ticket_office.infra.server import Server
+from ticket_office.infra.idempotency import IdempotencyStore
+from ticket_office.infra.in_process_client import InProcessClient
+from ticket_office.infra.server import Server, serve
+
+DEFAULT_TRAINS_PATH = Path(__file__).parent.parent / "train_data" / "trains.json"
 
 
 def main() -> None:
-    Server.reserve.exposed = True  # type: ignore[attr-defined]
-    cherrypy.config.update({"server.socket_port": 8083})
-    client = HttpClient()
-    ticket_office = TicketOffice(client=client)
-    server = Server(ticket_office=ticket_office)
-    cherrypy.quickstart(server)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="keep trains and booking references in this process instead of "
+        "using the train_data and booking_reference services. Not durable: "
+        "reservations are lost and booking references are reused after a "
+        "restart, only use it for tests and benchmarks",
+    )
+    parser.add_argument(
+        "--trains",
+        type=Path,
+        default=DEFAULT_TRAINS_PATH,
+        help="trains to load when using --in-process",
+    )
+    parser.add_argument(
+        "--host",
+        default="0.0.0.0",
+        help="address to listen on, whatever the number of workers",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes serving requests (0: one per CPU). "
+        "Idempotency keys are only supported with one worker",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=10,
+        help="number of connections handled at the same time by each worker",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=5,
+        help="number of connections waiting to be accepted by each worker",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=0,
+        help="group reservations for the same train made within this many "
+        "seconds of each other (0: no batching), see BatchingTicketOffice",
+    )
+    parser.add_argument(
+        "--booking-reference-block-size",
+        type=int,
+        default=0,
+        help="number of booking references leased at once from the "
+        "booking_reference service (0: one at a time)",
+    )
+    args = parser.parse_args()
+    if args.booking_reference_block_size < 0:
+        parser.error("--booking-reference-block-size cannot be negative")
+    if args.batch_window < 0:
+        parser.error("--batch-window cannot be negative")
+    if args.workers < 0:
+        parser.error("--workers cannot be negative")
+    workers = args.workers or os.cpu_count() or 1
+    if args.in_process and workers > 1:
+        parser.error("--in-process cannot be used with more than one worker")
+
+    def make_server() -> Server:
+        client: Client
+        if args.in_process:
+            client = InProcessClient.from_json_file(args.trains)
+        else:
+            client = HttpClient(
+                booking_reference_block_size=args.booking_reference_block_size
+            )
+        ticket_office = TicketOffice(client=client)
+        reserver: Reserver = ticket_office
+        if args.batch_window:
+            reserver = BatchingTicketOffice(ticket_office, window=args.batch_window)
+        # Note: each worker would have its own store, and retries usually
+        # reach another worker, so idempotency keys are rejected instead
+        idempotency_store = IdempotencyStore() if workers == 1 else None
+        return Server(ticket_office=reserver, idempotency_store=idempotency_store)
+
+    serve(
+        make_server,
+        host=args.host,
+        workers=workers,
+        threads=args.threads,
+        backlog=args.backlog,
+    )
 
 
 if __name__ == "__main__":
@@ -1,16 +1,20 @@
 from ticket_office.domain.client import (
+    AsyncClient,
     BookingReference,
     Client,
     Reservation,
+    ReservationConflict,
     Train,
     TrainId,
 )
+from ticket_office.domain.reservation import SeatId
 
 
 class FakeClient(Client):
     def __init__(self) -> None:
         self.train: Train | None = None
         self._booking_reference: BookingReference | None = None
+        self.get_train_calls = 0
 
     def set_booking_reference(self, booking_reference: BookingReference) -> None:
         self._booking_reference = booking_reference
@@ -20,20 +24,65 @@ class FakeClient(Client):
 
     def get_train(self, train_id: TrainId) -> Train:
         assert self.train
+        self.get_train_calls += 1
         return self.train
 
     def make_reservation(self, reservation: Reservation) -> None:
         assert self.train
+        train_version = reservation.train_version
+        if train_version is not None and train_version != self.train.version:
+            raise ReservationConflict(
+                f"Train changed since version {reservation.train_version}"
+            )
         for seat_id in reservation.seats:
             existing_reference = self.train.booking_reference(seat_id)
             if (
                 existing_reference
                 and existing_reference != reservation.booking_reference
             ):
-                raise Exception(
+                raise ReservationConflict(
                     f"Seat {seat_id} already booked with reference '{existing_reference}'"
                 )
 
     def get_booking_reference(self) -> BookingReference:
         assert self._booking_reference
         return self._booking_reference
+
+
+class FakeAsyncClient(AsyncClient):
+    def __init__(self, client: FakeClient) -> None:
+        self.client = client
+
+    async def get_train(self, train_id: TrainId) -> Train:
+        return self.client.get_train(train_id)
+
+    async def make_reservation(self, reservation: Reservation) -> None:
+        self.client.make_reservation(reservation)
+
+    async def get_booking_reference(self) -> BookingReference:
+        return self.client.get_booking_reference()
+
+
+class BusyClient(FakeClient):
+    """
+    Someone else books a seat on the train right after our first reservation,
+    and booking references are counted
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reservation_count = 0
+        self.booking_reference_counts: list[int] = []
+
+    def make_reservation(self, reservation: Reservation) -> None:
+        super().make_reservation(reservation)
+        assert self.train
+        self.train.record_reservation(reservation)
+        self.reservation_count += 1
+        if self.reservation_count == 1:
+            self.train.book([SeatId.parse("10A")], BookingReference("other"))
+            self.train.version = (self.train.version or 0) + 1
+
+    def get_booking_references(self, count: int) -> list[BookingReference]:
+        self.booking_reference_counts.append(count)
+        return [BookingReference(f"{n}") for n in range(count)]
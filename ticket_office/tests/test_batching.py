@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+from ticket_office.domain.batching import BatchingTicketOffice
+from ticket_office.domain.reservation import (
+    BookingReference,
+    Reservation,
+    TrainId,
+)
+from ticket_office.domain.ticket_office import NotEnoughFreeSeats, TicketOffice
+
+from .conftest import make_empty_train
+from .helpers import BusyClient, FakeClient
+
+
+@pytest.fixture
+def ticket_office(fake_client: FakeClient) -> TicketOffice:
+    fake_client.set_booking_reference(BookingReference("new"))
+    return TicketOffice(client=fake_client)
+
+
+def reserve_concurrently(
+    batching_ticket_office: BatchingTicketOffice,
+    train_id: TrainId,
+    seat_counts: list[int],
+) -> list[Reservation | Exception]:
+    results: list[Reservation | Exception] = [
+        Exception("not reserved") for _ in seat_counts
+    ]
+
+    def reserve(i: int) -> None:
+        try:
+            results[i] = batching_ticket_office.reserve(train_id, seat_counts[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [
+        threading.Thread(target=reserve, args=(i,)) for i in range(len(seat_counts))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_reservations_on_the_same_train_are_batched(
+    train_id: TrainId, fake_client: FakeClient, ticket_office: TicketOffice
+) -> None:
+    batching_ticket_office = BatchingTicketOffice(
+        ticket_office, window=5, max_batch_size=4
+    )
+
+    results = reserve_concurrently(batching_ticket_office, train_id, [2, 2, 3, 1])
+
+    assert fake_client.get_train_calls == 1
+    reserved_seats = []
+    for result in results:
+        assert isinstance(result, Reservation)
+        reserved_seats.extend(result.seats)
+    assert len(reserved_seats) == 8
+    assert len(set(reserved_seats)) == 8
+
+
+def test_each_caller_gets_its_own_error(
+    train_id: TrainId, ticket_office: TicketOffice
+) -> None:
+    batching_ticket_office = BatchingTicketOffice(
+        ticket_office, window=5, max_batch_size=2
+    )
+
+    results = reserve_concurrently(batching_ticket_office, train_id, [3, 40])
+
+    assert sorted(type(r).__name__ for r in results) == [
+        "NotEnoughFreeSeats",
+        "Reservation",
+    ]
+
+
+def test_reserve_many_allocates_distinct_seats(
+    train_id: TrainId, fake_client: FakeClient, ticket_office: TicketOffice
+) -> None:
+    results = list(ticket_office.reserve_many(train_id, [7, 7, 40]))
+
+    first, second, third = results
+    assert isinstance(first, Reservation)
+    assert isinstance(second, Reservation)
+    assert not set(first.seats) & set(second.seats)
+    assert isinstance(third, NotEnoughFreeSeats)
+    assert fake_client.get_train_calls == 1
+
+
+def test_reserve_many_retries_after_a_conflict(train_id: TrainId) -> None:
+    client = BusyClient()
+    train = make_empty_train(train_id)
+    train.version = 1
+    client.set_train(train)
+    ticket_office = TicketOffice(client=client, retry_delay=0)
+
+    results = list(ticket_office.reserve_many(train_id, [1, 1, 1, 1]))
+
+    assert all(isinstance(r, Reservation) for r in results)
+    assert client.get_train_calls == 2
+    # The reference of the reservation that conflicted is not lost
+    assert client.booking_reference_counts == [4]
+    assert len(ticket_office.spare_booking_references) == 0
+
+
+def test_reserve_many_is_not_batched_again(
+    train_id: TrainId, fake_client: FakeClient, ticket_office: TicketOffice
+) -> None:
+    batching_ticket_office = BatchingTicketOffice(ticket_office, window=5)
+
+    results = list(batching_ticket_office.reserve_many(train_id, [2, 3]))
+
+    assert all(isinstance(r, Reservation) for r in results)
+    assert fake_client.get_train_calls == 1
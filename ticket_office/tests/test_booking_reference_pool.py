@@ -0,0 +1,89 @@
+import itertools
+import threading
+
+import pytest
+
+from ticket_office.domain.reservation import BookingReference
+from ticket_office.infra.booking_reference_pool import BookingReferencePool, Lease
+
+from .test_ttl_cache import FakeClock
+
+
+class FakeLeases:
+    def __init__(self, block_size: int, lease_seconds: float = 60) -> None:
+        self.block_size = block_size
+        self.lease_seconds = lease_seconds
+        self.calls = 0
+        self.fail = False
+        self._counter = itertools.count()
+
+    def __call__(self) -> Lease:
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("booking_reference is down")
+        references = [
+            BookingReference(str(next(self._counter))) for _ in range(self.block_size)
+        ]
+        return references, self.lease_seconds
+
+
+def test_references_are_leased_in_blocks() -> None:
+    leases = FakeLeases(block_size=10)
+    pool = BookingReferencePool(leases, low_water=0)
+
+    references = [pool.take() for _ in range(10)]
+
+    assert [str(r) for r in references] == [str(i) for i in range(10)]
+    assert leases.calls == 1
+
+
+def test_pool_is_refilled_before_running_out() -> None:
+    leases = FakeLeases(block_size=10)
+    pool = BookingReferencePool(leases, low_water=5)
+
+    for _ in range(6):
+        pool.take()
+    pool._executor.shutdown(wait=True)
+
+    assert leases.calls == 2
+    assert len(pool) == 14
+
+
+def test_expired_references_are_not_used() -> None:
+    clock = FakeClock()
+    leases = FakeLeases(block_size=10, lease_seconds=60)
+    pool = BookingReferencePool(leases, low_water=0, clock=clock)
+    pool.take()
+
+    clock.now = 60
+
+    assert str(pool.take()) == "10"
+
+
+def test_failed_leases_are_reported_when_the_pool_is_empty() -> None:
+    leases = FakeLeases(block_size=10)
+    leases.fail = True
+    pool = BookingReferencePool(leases, low_water=0)
+
+    with pytest.raises(ConnectionError):
+        pool.take()
+
+    leases.fail = False
+    assert str(pool.take()) == "0"
+
+
+def test_concurrent_takes_get_different_references() -> None:
+    pool = BookingReferencePool(FakeLeases(block_size=7), low_water=2)
+    taken: list[BookingReference] = []
+
+    def take() -> None:
+        for _ in range(50):
+            taken.append(pool.take())
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(taken)) == 400
@@ -0,0 +1,120 @@
+import pytest
+
+from ticket_office.domain.reservation import (
+    BookingReference,
+    Reservation,
+    SeatId,
+    Train,
+    TrainId,
+)
+from ticket_office.infra.caching_client import CachingClient
+
+from .helpers import FakeClient
+from .test_ttl_cache import FakeClock
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def caching_client(fake_client: FakeClient, clock: FakeClock) -> CachingClient:
+    return CachingClient(fake_client, ttl=1, clock=clock)
+
+
+def test_trains_are_cached(
+    train_id: TrainId, fake_client: FakeClient, caching_client: CachingClient
+) -> None:
+    caching_client.get_train(train_id)
+    caching_client.get_train(train_id)
+
+    assert fake_client.get_train_calls == 1
+
+
+def test_callers_get_their_own_copy_of_the_train(
+    train_id: TrainId, caching_client: CachingClient
+) -> None:
+    first = caching_client.get_train(train_id)
+    first.book([SeatId.parse("01A")], BookingReference("123"))
+
+    second = caching_client.get_train(train_id)
+
+    assert second.is_free(SeatId.parse("01A"))
+
+
+def test_expired_trains_are_refreshed(
+    train_id: TrainId,
+    fake_client: FakeClient,
+    caching_client: CachingClient,
+    clock: FakeClock,
+) -> None:
+    caching_client.get_train(train_id)
+
+    clock.now = 2
+    caching_client.get_train(train_id)
+
+    assert fake_client.get_train_calls == 2
+
+
+def test_expired_trains_are_refreshed_from_a_copy(
+    train_id: TrainId,
+    fake_client: FakeClient,
+    caching_client: CachingClient,
+    clock: FakeClock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    refreshed: list[Train] = []
+
+    def refresh_train(train: Train) -> Train:
+        refreshed.append(train)
+        return train
+
+    monkeypatch.setattr(fake_client, "refresh_train", refresh_train)
+    caching_client.get_train(train_id)
+    cached = caching_client._trains.get_stale(train_id)
+
+    clock.now = 2
+    caching_client.get_train(train_id)
+
+    (train,) = refreshed
+    assert cached is not None
+    assert train is not cached
+
+
+def test_reservations_are_applied_to_the_cached_train(
+    train_id: TrainId,
+    fake_client: FakeClient,
+    caching_client: CachingClient,
+) -> None:
+    cached = caching_client.get_train(train_id)
+    seat_id = SeatId.parse("01A")
+    reservation = Reservation(
+        train=train_id, seats=[seat_id], booking_reference=BookingReference("123")
+    )
+
+    caching_client.make_reservation(reservation)
+
+    assert cached.is_free(seat_id)
+    assert not caching_client.get_train(train_id).is_free(seat_id)
+    assert fake_client.get_train_calls == 1
+
+
+def test_failed_reservations_evict_the_cached_train(
+    train_id: TrainId,
+    train: Train,
+    fake_client: FakeClient,
+    caching_client: CachingClient,
+) -> None:
+    seat_id = SeatId.parse("01A")
+    train.book([seat_id], BookingReference("old"))
+    caching_client.get_train(train_id)
+    reservation = Reservation(
+        train=train_id, seats=[seat_id], booking_reference=BookingReference("new")
+    )
+
+    with pytest.raises(Exception):
+        caching_client.make_reservation(reservation)
+    caching_client.get_train(train_id)
+
+    assert fake_client.get_train_calls == 2
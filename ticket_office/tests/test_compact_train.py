@@ -0,0 +1,154 @@
+import pytest
+
+from ticket_office.domain.compact_train import CompactTrain
+from ticket_office.domain.reservation import (
+    AlreadyBooked,
+    BookingReference,
+    CoachId,
+    Seat,
+    SeatId,
+    SeatNotFound,
+    SeatNumber,
+    Train,
+    TrainId,
+)
+
+
+@pytest.fixture
+def compact_train(train: Train) -> CompactTrain:
+    return CompactTrain(id=train.id, seats=train.seats())
+
+
+def test_compact_train_has_the_same_seats(
+    train: Train, compact_train: CompactTrain
+) -> None:
+    assert compact_train.coaches() == train.coaches()
+    assert [s.id for s in compact_train.seats()] == [s.id for s in train.seats()]
+    for seat in compact_train.seats():
+        assert seat.is_free
+
+
+def test_can_book_some_seats(compact_train: CompactTrain) -> None:
+    seat_1 = SeatId.parse("01A")
+    seat_2 = SeatId.parse("02A")
+    booking_reference = BookingReference("123456")
+
+    compact_train.book([seat_1, seat_2], booking_reference)
+
+    for seat in seat_1, seat_2:
+        assert not compact_train.is_free(seat)
+        assert compact_train.booking_reference(seat) == booking_reference
+    assert compact_train.is_free(SeatId.parse("03A"))
+    assert compact_train.occupancy_for_coach(CoachId("A")) == 0.2
+    assert compact_train.occupancy() == 0.04
+
+
+def test_can_book_the_same_seat_twice_with_the_same_reference(
+    compact_train: CompactTrain,
+) -> None:
+    seat_id = SeatId.parse("01A")
+    booking_reference = BookingReference("123456")
+
+    compact_train.book([seat_id], booking_reference)
+    compact_train.book([seat_id], booking_reference)
+
+    assert compact_train.occupancy_for_coach(CoachId("A")) == 0.1
+
+
+def test_cannot_book_with_conflicting_references(
+    compact_train: CompactTrain,
+) -> None:
+    seat_id = SeatId.parse("01A")
+    compact_train.book([seat_id], BookingReference("123"))
+
+    with pytest.raises(AlreadyBooked):
+        compact_train.book([seat_id], BookingReference("456"))
+
+
+def test_unknown_seats(compact_train: CompactTrain) -> None:
+    seat_id = SeatId.parse("42Z")
+
+    assert compact_train.booking_reference(seat_id) is None
+    with pytest.raises(SeatNotFound):
+        compact_train.is_free(seat_id)
+    with pytest.raises(SeatNotFound):
+        compact_train.book([seat_id], BookingReference("123"))
+
+
+def test_first_free_seats(compact_train: CompactTrain) -> None:
+    booked = [SeatId.parse(s) for s in ["01B", "02B", "04B"]]
+    compact_train.book(booked, BookingReference("123"))
+
+    first_free = compact_train.first_free_seats(CoachId("B"), 3)
+    assert [s.id for s in first_free] == [
+        SeatId.parse("03B"),
+        SeatId.parse("05B"),
+        SeatId.parse("06B"),
+    ]
+
+    compact_train.book([SeatId.parse("03B")], BookingReference("456"))
+    first_free = compact_train.first_free_seats(CoachId("B"), 1)
+    assert [s.id for s in first_free] == [SeatId.parse("05B")]
+
+
+def test_keeps_existing_bookings(train: Train) -> None:
+    seat_id = SeatId.parse("01C")
+    booking_reference = BookingReference("123")
+    train.book([seat_id], booking_reference)
+
+    compact_train = CompactTrain(id=TrainId("express_2000"), seats=train.seats())
+
+    assert compact_train.booking_reference(seat_id) == booking_reference
+    assert compact_train.occupancy() == train.occupancy()
+
+
+def test_copies_are_independent(compact_train: CompactTrain) -> None:
+    seat_id = SeatId.parse("01A")
+    copy = compact_train.copy()
+
+    copy.book([seat_id], BookingReference("123"))
+
+    assert compact_train.is_free(seat_id)
+    assert compact_train.occupancy() == 0
+    assert not copy.is_free(seat_id)
+
+
+def test_update_seats(compact_train: CompactTrain) -> None:
+    compact_train.book(
+        [SeatId.parse("01A"), SeatId.parse("02A")], BookingReference("old")
+    )
+    compact_train.first_free_seats(CoachId("A"), 1)
+    changes = [
+        Seat.free_seat_with_id(SeatId.parse("01A")),
+        Seat(
+            number=SeatNumber(3),
+            coach_id=CoachId("A"),
+            booking_reference=BookingReference("new"),
+        ),
+    ]
+
+    compact_train.update_seats(changes, version=4)
+
+    assert compact_train.version == 4
+    assert compact_train.is_free(SeatId.parse("01A"))
+    assert compact_train.booking_reference(SeatId.parse("03A")) == BookingReference(
+        "new"
+    )
+    assert compact_train.occupancy_for_coach(CoachId("A")) == 0.2
+    first_free = compact_train.first_free_seats(CoachId("A"), 2)
+    assert [s.id for s in first_free] == [SeatId.parse("01A"), SeatId.parse("04A")]
+
+
+def test_to_slots_and_back(compact_train: CompactTrain) -> None:
+    compact_train.book([SeatId.parse("02A")], BookingReference("123"))
+
+    slots, references = compact_train.to_slots()
+    slots[CoachId("A")][1] = 1
+    copy = CompactTrain.from_slots(
+        id=compact_train.id, slots=slots, references=references
+    )
+
+    assert references == [BookingReference("123")]
+    assert compact_train.is_free(SeatId.parse("01A"))
+    assert not copy.is_free(SeatId.parse("01A"))
+    assert not copy.is_free(SeatId.parse("02A"))
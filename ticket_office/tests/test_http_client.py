@@ -1,10 +1,34 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+from ticket_office.domain.client import ReservationConflict
+from ticket_office.domain.compact_train import CompactTrain
 from ticket_office.domain.reservation import (
     BookingReference,
+    CoachId,
     Reservation,
     SeatId,
+    Train,
     TrainId,
 )
-from ticket_office.infra.http_client import HttpClient
+from ticket_office.infra.http_client import (
+    AsyncHttpClient,
+    HttpClient,
+    parse_train_bytes,
+    parse_train_data,
+)
+
+TRAIN_DATA = b"""
+{"seats": {
+  "1A": {"coach": "A", "seat_number": "1", "booking_reference": ""},
+  "2A": {"coach": "A", "seat_number": "2", "booking_reference": "75bcd15"},
+  "1B": { "coach" : "B", "seat_number" : "1", "booking_reference" : ""}
+}}
+"""
 
 
 def test_can_get_empty_train(train_id: TrainId, http_client: HttpClient) -> None:
@@ -34,6 +58,264 @@ def test_can_book_some_seats(train_id: TrainId, http_client: HttpClient) -> None
         assert not train.is_free(seat_id)
 
 
+def test_conditional_reservations(train_id: TrainId, http_client: HttpClient) -> None:
+    train = http_client.get_train(train_id)
+    assert train.version is not None
+    booking_reference = http_client.get_booking_reference()
+    first = Reservation(
+        train=train_id,
+        seats=[SeatId.parse("01A")],
+        booking_reference=booking_reference,
+        train_version=train.version,
+    )
+    http_client.make_reservation(first)
+
+    second = Reservation(
+        train=train_id,
+        seats=[SeatId.parse("02A")],
+        booking_reference=booking_reference,
+        train_version=train.version,
+    )
+    with pytest.raises(ReservationConflict):
+        http_client.make_reservation(second)
+
+    assert http_client.get_train(train_id).version == train.version + 1
+
+
+def test_refresh_unchanged_train(train_id: TrainId, http_client: HttpClient) -> None:
+    train = http_client.get_train(train_id)
+
+    assert http_client.refresh_train(train) is train
+
+
+def test_refresh_changed_train(train_id: TrainId, http_client: HttpClient) -> None:
+    train = http_client.get_train(train_id)
+    seat_id = SeatId.parse("01A")
+    reservation = Reservation(
+        train=train_id, seats=[seat_id], booking_reference=BookingReference("123")
+    )
+    http_client.make_reservation(reservation)
+
+    refreshed = http_client.refresh_train(train)
+
+    assert refreshed is not train
+    assert not refreshed.is_free(seat_id)
+
+
+def test_refresh_train_after_reset(train_id: TrainId, http_client: HttpClient) -> None:
+    seat_id = SeatId.parse("01A")
+    reservation = Reservation(
+        train=train_id, seats=[seat_id], booking_reference=BookingReference("123")
+    )
+    http_client.make_reservation(reservation)
+    train = http_client.get_train(train_id)
+
+    http_client.reset(train_id)
+    refreshed = http_client.refresh_train(train)
+
+    assert refreshed.is_free(seat_id)
+    assert not train.is_free(seat_id)
+    assert refreshed.version == http_client.get_train(train_id).version
+
+
+def test_refresh_train_with_unknown_version(
+    train_id: TrainId, http_client: HttpClient
+) -> None:
+    train = http_client.get_train(train_id)
+    current_version = train.version
+    train.version = 10_000
+
+    refreshed = http_client.refresh_train(train)
+
+    assert isinstance(refreshed, CompactTrain)
+    assert refreshed.version == current_version
+    assert refreshed.seats() == http_client.get_train(train_id).seats()
+
+
+def test_refresh_train_without_version(
+    train_id: TrainId, http_client: HttpClient
+) -> None:
+    train = http_client.get_train(train_id)
+    current_version = train.version
+    train.version = None
+
+    refreshed = http_client.refresh_train(train)
+
+    assert refreshed is not train
+    assert refreshed.version == current_version
+
+
+def test_refresh_train_after_own_reservation(
+    train_id: TrainId, http_client: HttpClient
+) -> None:
+    train = http_client.get_train(train_id)
+    reservation = Reservation(
+        train=train_id,
+        seats=[SeatId.parse("01A")],
+        booking_reference=BookingReference("123"),
+        train_version=train.version,
+    )
+    http_client.make_reservation(reservation)
+    train.record_reservation(reservation)
+
+    assert http_client.refresh_train(train) is train
+
+
+def test_wait_for_changes(train_id: TrainId, http_client: HttpClient) -> None:
+    train = http_client.get_train(train_id)
+    seat_id = SeatId.parse("01A")
+    reservation = Reservation(
+        train=train_id, seats=[seat_id], booking_reference=BookingReference("123")
+    )
+
+    timer = threading.Timer(0.1, http_client.make_reservation, args=(reservation,))
+    timer.start()
+    changed = http_client.wait_for_changes(train, timeout=5)
+    timer.join()
+
+    assert not changed.is_free(seat_id)
+
+
+def test_wait_for_changes_times_out(train_id: TrainId, http_client: HttpClient) -> None:
+    train = http_client.get_train(train_id)
+
+    assert http_client.wait_for_changes(train, timeout=0.1) is train
+
+
+def test_get_occupancy_summary(train_id: TrainId, http_client: HttpClient) -> None:
+    reservation = Reservation(
+        train=train_id,
+        seats=[SeatId.parse("01A"), SeatId.parse("03A")],
+        booking_reference=BookingReference("123"),
+    )
+    http_client.make_reservation(reservation)
+
+    summary = http_client.get_occupancy_summary(train_id, free_seat_count=2)
+
+    coach_a = summary.coaches_by_id[CoachId("A")]
+    assert coach_a.booked_count == 2
+    assert [str(s) for s in coach_a.free_seats] == ["2A", "4A"]
+    assert summary.version == http_client.get_train(train_id).version
+
+
+def test_compact_and_json_trains_match(
+    train_id: TrainId, http_client: HttpClient
+) -> None:
+    reservation = Reservation(
+        train=train_id,
+        seats=[SeatId.parse("01A"), SeatId.parse("02A")],
+        booking_reference=BookingReference("123"),
+    )
+    http_client.make_reservation(reservation)
+    json_client = HttpClient(compact=False)
+
+    compact_train = http_client.get_train(train_id)
+    json_train = json_client.get_train(train_id)
+
+    assert compact_train.seats() == json_train.seats()
+    assert compact_train.version == json_train.version
+
+
 def test_can_get_booking_reference(http_client: HttpClient) -> None:
     booking_reference = http_client.get_booking_reference()
     assert booking_reference
+
+
+def mock_booking_references(client: HttpClient) -> list[str]:
+    """
+    Make the client get booking references from a fake booking_reference
+    service, and return the paths of the requests it receives
+    """
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        count = int(request.url.params["count"])
+        references = [f"{n:x}" for n in range(count)]
+        return httpx.Response(
+            200, json={"references": references, "lease_seconds": 300}
+        )
+
+    client._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return paths
+
+
+def test_booking_references_are_leased_in_blocks() -> None:
+    client = HttpClient(booking_reference_block_size=10)
+    paths = mock_booking_references(client)
+
+    references = [client.get_booking_reference() for _ in range(5)]
+
+    assert [r.value for r in references] == ["0", "1", "2", "3", "4"]
+    assert paths == ["/booking_references"]
+
+
+def test_get_several_booking_references_at_once() -> None:
+    client = HttpClient()
+    paths = mock_booking_references(client)
+
+    references = client.get_booking_references(3)
+
+    assert [r.value for r in references] == ["0", "1", "2"]
+    assert paths == ["/booking_references"]
+
+
+def test_async_client_can_book_some_seats(
+    train_id: TrainId, http_client: HttpClient
+) -> None:
+    async def book() -> Train:
+        client = AsyncHttpClient()
+        booking_reference = await client.get_booking_reference()
+        reservation = Reservation(
+            train=train_id,
+            seats=[SeatId.parse("01B")],
+            booking_reference=booking_reference,
+        )
+        await client.make_reservation(reservation)
+        train = await client.get_train(train_id)
+        await client.aclose()
+        return train
+
+    train = asyncio.run(book())
+
+    assert not train.is_free(SeatId.parse("01B"))
+
+
+def test_parse_train_bytes(train_id: TrainId) -> None:
+    train = parse_train_bytes(train_id, TRAIN_DATA)
+
+    assert train.id == train_id
+    assert [str(s.id) for s in train.seats()] == ["1A", "2A", "1B"]
+    assert train.booking_reference(SeatId.parse("02A")) == BookingReference("75bcd15")
+    assert train.is_free(SeatId.parse("01B"))
+    assert train.occupancy() == 1 / 3
+    assert train.version is None
+
+
+def test_parse_train_version(train_id: TrainId) -> None:
+    content = TRAIN_DATA.replace(b"}}\n", b'}, "version": 42}\n')
+
+    assert parse_train_bytes(train_id, content).version == 42
+    assert parse_train_data(train_id, json.loads(content)).version == 42
+
+
+@pytest.mark.parametrize("content", [b"null", b"{}"])
+def test_parse_train_bytes_fails_without_seats(
+    train_id: TrainId, content: bytes
+) -> None:
+    with pytest.raises((TypeError, KeyError)):
+        parse_train_bytes(train_id, content)
+
+
+def test_parse_train_bytes_falls_back_to_json_for_unusual_bodies(
+    train_id: TrainId,
+) -> None:
+    content = TRAIN_DATA.replace(
+        b'"coach": "A", "seat_number": "1"', b'"seat_number": "1", "coach": "A"'
+    )
+
+    train = parse_train_bytes(train_id, content)
+
+    expected = parse_train_data(train_id, json.loads(TRAIN_DATA))
+    assert [s.id for s in train.seats()] == [s.id for s in expected.seats()]
+    assert train.occupancy() == expected.occupancy()
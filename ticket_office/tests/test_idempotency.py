@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+from ticket_office.infra.idempotency import (
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    RequestInProgress,
+)
+
+from .test_ttl_cache import FakeClock
+
+
+def test_same_key_returns_same_response_without_running_again() -> None:
+    store = IdempotencyStore()
+    calls = []
+
+    def respond() -> str:
+        calls.append(1)
+        return f"response {len(calls)}"
+
+    assert store.run("key", ("express_2000", "2"), respond) == "response 1"
+    assert store.run("key", ("express_2000", "2"), respond) == "response 1"
+    assert len(calls) == 1
+
+
+def test_key_reused_for_another_request() -> None:
+    store = IdempotencyStore()
+    store.run("key", ("express_2000", "2"), lambda: "ok")
+
+    with pytest.raises(IdempotencyKeyReused):
+        store.run("key", ("express_2000", "3"), lambda: "ok")
+
+
+def test_failures_are_not_remembered() -> None:
+    store = IdempotencyStore()
+
+    def fail() -> str:
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.run("key", "request", fail)
+
+    assert store.run("key", "request", lambda: "ok") == "ok"
+
+
+def test_responses_expire() -> None:
+    clock = FakeClock()
+    store = IdempotencyStore(ttl=10, clock=clock)
+    store.run("key", "request", lambda: "first")
+
+    clock.now = 11
+
+    assert store.run("key", "request", lambda: "second") == "second"
+
+
+def test_duplicates_wait_for_the_running_request() -> None:
+    store = IdempotencyStore()
+    started = threading.Event()
+    proceed = threading.Event()
+    calls = []
+
+    def respond() -> str:
+        calls.append(1)
+        started.set()
+        proceed.wait(timeout=5)
+        return "ok"
+
+    results = []
+    first = threading.Thread(
+        target=lambda: results.append(store.run("key", "request", respond))
+    )
+    first.start()
+    started.wait(timeout=5)
+    second = threading.Thread(
+        target=lambda: results.append(store.run("key", "request", respond))
+    )
+    second.start()
+    proceed.set()
+    first.join()
+    second.join()
+
+    assert results == ["ok", "ok"]
+    assert len(calls) == 1
+
+
+def test_running_requests_are_not_evicted() -> None:
+    store = IdempotencyStore(max_size=1)
+    started = threading.Event()
+    proceed = threading.Event()
+    calls = []
+
+    def respond() -> str:
+        calls.append(1)
+        started.set()
+        proceed.wait(timeout=5)
+        return "ok"
+
+    first = threading.Thread(target=store.run, args=("key", "request", respond))
+    first.start()
+    started.wait(timeout=5)
+    store.run("other", "request", lambda: "other")
+    store.run("another", "request", lambda: "another")
+    proceed.set()
+    first.join()
+
+    assert store.run("key", "request", respond) == "ok"
+    assert len(calls) == 1
+
+
+def test_stop_waiting_for_a_running_request() -> None:
+    store = IdempotencyStore(wait_timeout=0.01)
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def respond() -> str:
+        started.set()
+        proceed.wait(timeout=5)
+        return "ok"
+
+    first = threading.Thread(target=store.run, args=("key", "request", respond))
+    first.start()
+    started.wait(timeout=5)
+    try:
+        with pytest.raises(RequestInProgress):
+            store.run("key", "request", respond)
+    finally:
+        proceed.set()
+        first.join()
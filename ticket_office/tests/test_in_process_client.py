@@ -0,0 +1,121 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from ticket_office.domain.client import ReservationConflict
+from ticket_office.domain.reservation import (
+    BookingReference,
+    Reservation,
+    SeatId,
+    SeatNotFound,
+    Train,
+    TrainId,
+)
+from ticket_office.domain.ticket_office import NotEnoughFreeSeats, TicketOffice
+from ticket_office.infra.in_process_client import InProcessClient
+
+TRAINS_PATH = Path(__file__).parent.parent.parent / "train_data" / "trains.json"
+
+
+@pytest.fixture
+def client(train: Train) -> InProcessClient:
+    return InProcessClient([train])
+
+
+def reservation(
+    train_id: TrainId, seats: list[str], booking_reference: str, **kwargs: int
+) -> Reservation:
+    return Reservation(
+        train=train_id,
+        seats=[SeatId.parse(s) for s in seats],
+        booking_reference=BookingReference(booking_reference),
+        **kwargs,
+    )
+
+
+def test_load_trains_from_json_file() -> None:
+    client = InProcessClient.from_json_file(TRAINS_PATH)
+
+    train = client.get_train(TrainId("express_2000"))
+
+    assert train.version == 0
+    assert all(s.is_free for s in train.seats())
+
+
+def test_make_reservation(train_id: TrainId, client: InProcessClient) -> None:
+    before = client.get_train(train_id)
+
+    client.make_reservation(reservation(train_id, ["01A", "02A"], "123"))
+
+    after = client.get_train(train_id)
+    assert not after.is_free(SeatId.parse("01A"))
+    assert after.version == 1
+    assert before.is_free(SeatId.parse("01A"))
+
+
+def test_seats_booked_by_someone_else(
+    train_id: TrainId, client: InProcessClient
+) -> None:
+    client.make_reservation(reservation(train_id, ["01A"], "123"))
+
+    with pytest.raises(ReservationConflict):
+        client.make_reservation(reservation(train_id, ["02A", "01A"], "456"))
+    assert client.get_train(train_id).is_free(SeatId.parse("02A"))
+
+
+def test_train_changed_since_version(
+    train_id: TrainId, client: InProcessClient
+) -> None:
+    client.make_reservation(reservation(train_id, ["01A"], "123"))
+
+    with pytest.raises(ReservationConflict):
+        client.make_reservation(reservation(train_id, ["02A"], "456", train_version=0))
+
+
+def test_unknown_seat(train_id: TrainId, client: InProcessClient) -> None:
+    with pytest.raises(SeatNotFound):
+        client.make_reservation(reservation(train_id, ["01Z"], "123"))
+
+
+def test_booking_references(client: InProcessClient) -> None:
+    assert client.get_booking_reference() == BookingReference("75bcd16")
+    assert client.get_booking_reference() == BookingReference("75bcd17")
+
+
+def test_concurrent_reservations_never_double_book(
+    train_id: TrainId, client: InProcessClient
+) -> None:
+    ticket_office = TicketOffice(client=client, max_attempts=100, retry_delay=0)
+    reservations: list[Reservation] = []
+
+    def reserve() -> None:
+        while True:
+            try:
+                reservations.append(ticket_office.reserve(train_id, 2))
+            except NotEnoughFreeSeats:
+                return
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked = [s for r in reservations for s in r.seats]
+    assert len(booked) == len(set(booked))
+    assert len({r.booking_reference for r in reservations}) == len(reservations)
+    train = client.get_train(train_id)
+    for r in reservations:
+        for seat_id in r.seats:
+            assert train.booking_reference(seat_id) == r.booking_reference
+
+
+def test_reset(train_id: TrainId, client: InProcessClient) -> None:
+    client.make_reservation(reservation(train_id, ["01A"], "123"))
+
+    client.reset(train_id)
+
+    train = client.get_train(train_id)
+    assert train.is_free(SeatId.parse("01A"))
+    assert train.version == 2
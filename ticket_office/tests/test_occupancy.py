@@ -0,0 +1,27 @@
+from ticket_office.domain.occupancy import OccupancySummary
+from ticket_office.domain.reservation import BookingReference, CoachId, SeatId, Train
+
+
+def test_occupancy_summary_for_train(train: Train) -> None:
+    train.book([SeatId.parse("01A"), SeatId.parse("03A")], BookingReference("123"))
+
+    summary = OccupancySummary.for_train(train, free_seat_count=2)
+
+    coach_a = summary.coaches_by_id[CoachId("A")]
+    assert coach_a.seat_count == 10
+    assert coach_a.booked_count == 2
+    assert [str(s) for s in coach_a.free_seats] == ["2A", "4A"]
+    assert summary.coaches() == train.coaches()
+
+
+def test_occupancy_summary_matches_train(train: Train) -> None:
+    train.book([SeatId.parse(f"0{i}A") for i in range(1, 6)], BookingReference("123"))
+
+    summary = OccupancySummary.for_train(train, free_seat_count=3)
+
+    coach_a = CoachId("A")
+    assert summary.occupancy_after_booking(3) == train.occupancy_after_booking(3)
+    assert summary.occupancy_for_coach_after_booking(
+        coach_a, 3
+    ) == train.occupancy_for_coach_after_booking(coach_a, 3)
+    assert summary.first_free_seats(coach_a, 2) == train.first_free_seats(coach_a, 2)
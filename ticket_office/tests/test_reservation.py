@@ -44,6 +44,40 @@ def test_seat_ids_are_value_objects() -> None:
     assert x <= y < z
 
 
+def test_seat_ids_are_interned() -> None:
+    x = SeatId.parse("01A")
+    y = SeatId(number=SeatNumber(1), coach_id=CoachId("A"))
+
+    assert x is y
+    assert x.coach_id is CoachId("A")
+    assert Seat.free_seat_with_id(x).id is x
+
+
+def test_seat_ids_are_sorted_by_their_string_representation() -> None:
+    ids = [SeatId.parse(s) for s in ["10A", "02B", "01B", "02A"]]
+
+    assert [str(i) for i in sorted(ids)] == ["10A", "1B", "2A", "2B"]
+
+
+def test_trusted_value_objects_are_not_validated() -> None:
+    booking_reference = BookingReference.trusted("")
+    assert str(booking_reference) == ""
+
+
+def test_trusted_interned_value_objects_are_shared() -> None:
+    assert CoachId.trusted("B") is CoachId("B")
+
+
+def test_cannot_create_invalid_interned_value_objects() -> None:
+    with pytest.raises(ValueError):
+        SeatNumber(0)
+
+
+def test_trusted_interned_value_objects_are_validated() -> None:
+    with pytest.raises(ValueError):
+        SeatNumber.trusted(0)
+
+
 def test_parse_seat_ids() -> None:
     x = SeatId.parse("01A")
     assert x.coach_id == CoachId("A")
@@ -104,3 +138,94 @@ def test_compute_occupancy_by_coach(train: Train) -> None:
     train.book(ids, booking_reference)
 
     assert train.occupancy_for_coach_after_booking(coach_id, seat_count=1) == 0.6
+
+
+def test_booking_a_seat_twice_does_not_change_occupancy(train: Train) -> None:
+    coach_id = CoachId("A")
+    booking_reference = BookingReference("1234")
+    ids = [SeatId(number=SeatNumber(i), coach_id=coach_id) for i in range(1, 6)]
+    train.book(ids, booking_reference)
+    train.book(ids, booking_reference)
+
+    assert train.occupancy_for_coach(coach_id) == 0.5
+    assert train.occupancy() == 0.1
+
+
+def test_occupancy_takes_seats_booked_before_creating_the_train() -> None:
+    seats = [
+        Seat(number=SeatNumber(1), coach_id=CoachId("A")),
+        Seat(
+            number=SeatNumber(2),
+            coach_id=CoachId("A"),
+            booking_reference=BookingReference("1234"),
+        ),
+    ]
+    train = Train(id=TrainId("express_2000"), seats=seats)
+
+    assert train.occupancy_for_coach(CoachId("A")) == 0.5
+    assert train.occupancy_after_booking(1) == 1.0
+
+
+def test_first_free_seats_skips_booked_seats(train: Train) -> None:
+    coach_id = CoachId("B")
+    booked = [SeatId.parse("01B"), SeatId.parse("03B")]
+    train.book(booked, BookingReference("1234"))
+
+    actual = train.first_free_seats(coach_id, 3)
+
+    assert [s.id for s in actual] == [
+        SeatId.parse("02B"),
+        SeatId.parse("04B"),
+        SeatId.parse("05B"),
+    ]
+
+
+def test_first_free_seats_in_a_full_coach(train: Train) -> None:
+    coach_id = CoachId("C")
+    ids = [SeatId(number=SeatNumber(i), coach_id=coach_id) for i in range(1, 11)]
+    train.book(ids, BookingReference("1234"))
+
+    assert train.first_free_seats(coach_id, 2) == []
+
+
+def test_copies_do_not_see_bookings_made_on_the_original(train: Train) -> None:
+    seat_id = SeatId.parse("01A")
+    copy = train.copy()
+
+    train.book([seat_id], BookingReference("123"))
+
+    assert copy.is_free(seat_id)
+    assert copy.first_free_seats(CoachId("A"), 1)[0].id == seat_id
+    assert copy.occupancy() == 0
+    assert not train.is_free(seat_id)
+
+
+def test_originals_do_not_see_bookings_made_on_the_copy(train: Train) -> None:
+    seat_id = SeatId.parse("01A")
+    copy = train.copy()
+
+    copy.book([seat_id], BookingReference("123"))
+
+    assert train.is_free(seat_id)
+    assert train.occupancy_for_coach(CoachId("A")) == 0
+
+
+def test_update_seats(train: Train) -> None:
+    train.book([SeatId.parse("01A"), SeatId.parse("02A")], BookingReference("old"))
+    changes = [
+        Seat.free_seat_with_id(SeatId.parse("01A")),
+        Seat(
+            number=SeatNumber(3),
+            coach_id=CoachId("A"),
+            booking_reference=BookingReference("new"),
+        ),
+    ]
+
+    train.update_seats(changes, version=4)
+
+    assert train.version == 4
+    assert train.is_free(SeatId.parse("01A"))
+    assert train.booking_reference(SeatId.parse("03A")) == BookingReference("new")
+    assert train.occupancy_for_coach(CoachId("A")) == 0.2
+    first_free = train.first_free_seats(CoachId("A"), 2)
+    assert [s.id for s in first_free] == [SeatId.parse("01A"), SeatId.parse("04A")]
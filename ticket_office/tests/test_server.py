@@ -0,0 +1,213 @@
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import cherrypy
+import httpx
+import pytest
+
+from ticket_office.domain.batching import BatchingTicketOffice
+from ticket_office.domain.reservation import BookingReference, TrainId
+from ticket_office.domain.ticket_office import TicketOffice
+from ticket_office.infra.idempotency import IdempotencyStore
+from ticket_office.infra.server import Server, serve
+
+from .conftest import make_empty_train
+from .helpers import BusyClient, FakeClient
+
+
+def reserve_lines(server: Server, requests: list[object]) -> list[dict[str, Any]]:
+    lines = [json.dumps(r).encode() for r in requests]
+    return [json.loads(line) for line in server.reserve_lines(lines)]
+
+
+def test_reserve_many_fetches_each_train_once(
+    train_id: TrainId, fake_client: FakeClient
+) -> None:
+    fake_client.set_booking_reference(BookingReference("123"))
+    server = Server(ticket_office=TicketOffice(client=fake_client))
+
+    results = reserve_lines(
+        server,
+        [
+            {"train_id": str(train_id), "seat_count": 2},
+            {"train_id": str(train_id), "seat_count": 3},
+        ],
+    )
+
+    assert [r["index"] for r in results] == [0, 1]
+    reservations = [r["reservation"] for r in results]
+    assert reservations[0]["seats"] == ["1A", "2A"]
+    assert reservations[1]["seats"] == ["3A", "4A", "5A"]
+    assert fake_client.get_train_calls == 1
+
+
+def test_reserve_many_reports_errors_per_line(
+    train_id: TrainId, fake_client: FakeClient
+) -> None:
+    fake_client.set_booking_reference(BookingReference("123"))
+    server = Server(ticket_office=TicketOffice(client=fake_client))
+
+    results = reserve_lines(
+        server,
+        [
+            {"train_id": str(train_id)},
+            {"train_id": str(train_id), "seat_count": 40},
+            "not a reservation",
+            {"train_id": str(train_id), "seat_count": 1},
+        ],
+    )
+
+    errors = {r["index"] for r in results if "error" in r}
+    reservations = {r["index"] for r in results if "reservation" in r}
+    assert errors == {0, 1, 2}
+    assert reservations == {3}
+
+
+def test_serve_batched_reservations(train_id: TrainId, fake_client: FakeClient) -> None:
+    fake_client.set_booking_reference(BookingReference("123"))
+    ticket_office = TicketOffice(client=fake_client)
+    server = Server(ticket_office=BatchingTicketOffice(ticket_office, window=0))
+
+    reservation = json.loads(server.reserve(str(train_id), "2"))
+    results = reserve_lines(server, [{"train_id": str(train_id), "seat_count": 3}])
+
+    assert len(reservation["seats"]) == 2
+    assert len(results[0]["reservation"]["seats"]) == 3
+
+
+def test_reserve_with_idempotency_key(
+    train_id: TrainId, fake_client: FakeClient
+) -> None:
+    fake_client.set_booking_reference(BookingReference("123"))
+    server = Server(
+        ticket_office=TicketOffice(client=fake_client),
+        idempotency_store=IdempotencyStore(),
+    )
+
+    cherrypy.request.headers["Idempotency-Key"] = "some-key"
+    try:
+        first = server.reserve(str(train_id), "2")
+        second = server.reserve(str(train_id), "2")
+        with pytest.raises(cherrypy.HTTPError) as e:
+            server.reserve(str(train_id), "3")
+    finally:
+        del cherrypy.request.headers["Idempotency-Key"]
+
+    assert first == second
+    assert json.loads(first)["seats"] == ["1A", "2A"]
+    assert e.value.status == 422
+    assert fake_client.get_train_calls == 1
+
+
+def test_reject_idempotency_keys_without_a_store(
+    train_id: TrainId, fake_client: FakeClient
+) -> None:
+    server = Server(ticket_office=TicketOffice(client=fake_client))
+
+    cherrypy.request.headers["Idempotency-Key"] = "some-key"
+    try:
+        with pytest.raises(cherrypy.HTTPError) as e:
+            server.reserve(str(train_id), "2")
+    finally:
+        del cherrypy.request.headers["Idempotency-Key"]
+
+    assert e.value.status == 501
+    assert fake_client.get_train_calls == 0
+
+
+def test_reserve_many_retries_after_a_conflict(train_id: TrainId) -> None:
+    client = BusyClient()
+    train = make_empty_train(train_id)
+    train.version = 1
+    client.set_train(train)
+    server = Server(ticket_office=TicketOffice(client=client, retry_delay=0))
+
+    results = reserve_lines(
+        server, [{"train_id": str(train_id), "seat_count": 2} for _ in range(4)]
+    )
+
+    assert all("reservation" in r for r in results)
+    seats = [s for r in results for s in r["reservation"]["seats"]]
+    assert len(set(seats)) == 8
+    assert "10A" not in seats
+    assert client.booking_reference_counts == [4]
+
+
+# Serves an empty ticket office with two workers, on localhost and the port
+# given on the command line. When a path is also given, the first worker to
+# start creates the file, then fails
+SERVE_SCRIPT = """
+import os
+import sys
+
+from ticket_office.domain.ticket_office import TicketOffice
+from ticket_office.infra.in_process_client import InProcessClient
+from ticket_office.infra.server import Server, serve
+
+
+def make_server():
+    if len(sys.argv) > 2:
+        os.close(os.open(sys.argv[2], os.O_CREAT | os.O_EXCL))
+    return Server(ticket_office=TicketOffice(client=InProcessClient([])))
+
+
+serve(make_server, host="127.0.0.1", port=int(sys.argv[1]), workers=2)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+def start_workers(*args: str) -> tuple[subprocess.Popen[bytes], int]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVE_SCRIPT, str(port), *args],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, port
+
+
+def test_serve_with_several_workers() -> None:
+    process, port = start_workers()
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                response = httpx.post(
+                    f"http://127.0.0.1:{port}/reserve_many", content=b""
+                )
+                break
+            except httpx.TransportError:
+                assert time.monotonic() < deadline, "timed out"
+                time.sleep(0.05)
+        assert response.status_code == 200
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+
+
+def test_stop_when_a_worker_fails(tmp_path: Path) -> None:
+    process, _ = start_workers(str(tmp_path / "failed"))
+    try:
+        assert process.wait(timeout=10) == 1
+    finally:
+        process.kill()
+
+
+def test_at_least_one_worker() -> None:
+    with pytest.raises(ValueError):
+        serve(
+            lambda: Server(ticket_office=TicketOffice(client=FakeClient())), workers=0
+        )
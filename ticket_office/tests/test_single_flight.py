@@ -0,0 +1,59 @@
+import threading
+
+from ticket_office.domain.reservation import (
+    BookingReference,
+    SeatId,
+    Train,
+    TrainId,
+)
+from ticket_office.infra.single_flight import SingleFlightClient
+
+from .helpers import FakeClient
+
+
+class SlowClient(FakeClient):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def get_train(self, train_id: TrainId) -> Train:
+        self.release.wait(timeout=5)
+        return super().get_train(train_id)
+
+
+def test_concurrent_calls_share_one_fetch(train_id: TrainId, train: Train) -> None:
+    slow_client = SlowClient()
+    slow_client.set_train(train)
+    client = SingleFlightClient(slow_client)
+    results: list[Train] = []
+
+    def get_train() -> None:
+        results.append(client.get_train(train_id))
+
+    threads = [threading.Thread(target=get_train) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    # Give all the threads a chance to wait on the same fetch
+    while len(client._in_flight) == 0:
+        pass
+    slow_client.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 10
+    assert slow_client.get_train_calls < 10
+
+
+def test_callers_get_independent_copies(
+    train_id: TrainId, fake_client: FakeClient
+) -> None:
+    client = SingleFlightClient(fake_client)
+    first = client.get_train(train_id)
+    second = client.get_train(train_id)
+    seat_id = SeatId.parse("01A")
+
+    first.book([seat_id], BookingReference("123"))
+
+    assert not first.is_free(seat_id)
+    assert second.is_free(seat_id)
+    assert second.occupancy() == 0
@@ -1,5 +1,11 @@
+import asyncio
+
 import pytest
 
+from ticket_office.domain import ticket_office as ticket_office_module
+from ticket_office.domain.client import ReservationConflict
+from ticket_office.domain.compact_train import CompactTrain
+from ticket_office.domain.occupancy import Occupancy
 from ticket_office.domain.reservation import (
     BookingReference,
     Reservation,
@@ -7,9 +13,15 @@ from ticket_office.domain.reservation import (
     Train,
     TrainId,
 )
-from ticket_office.domain.ticket_office import NotEnoughFreeSeats, TicketOffice
+from ticket_office.domain.ticket_office import (
+    AsyncTicketOffice,
+    NotEnoughFreeSeats,
+    TicketOffice,
+    backoff_delay,
+)
 
 from .conftest import FakeClient, make_empty_train
+from .helpers import FakeAsyncClient
 
 
 class Context:
@@ -167,6 +179,204 @@ def test_fail_when_no_coach_can_be_filled() -> None:
         context.reserve(3)
 
 
+def test_reserve_seats_asynchronously() -> None:
+    context = Context(booked_seats=["01A", "02A"])
+    context.fake_client.set_booking_reference(BookingReference("new"))
+    ticket_office = AsyncTicketOffice(client=FakeAsyncClient(context.fake_client))
+
+    reservation = asyncio.run(ticket_office.reserve(context.train_id, 4))
+
+    assert [str(s) for s in reservation.seats] == ["3A", "4A", "5A", "6A"]
+    check_reservation(reservation, train=context.train, seat_count=4)
+
+
+def test_reserve_asynchronously_fails_when_no_coach_can_be_filled() -> None:
+    # fmt: off
+    booked_seats = [
+        "01A", "02A", "03A", "04A", "05A", "06A", "07A",
+        "01B", "02B", "03B", "04B", "05B", "06B", "07B",
+        "01C", "02C", "03C", "04C", "05C", "06C", "07C",
+        "01D", "02D", "03D", "04D", "05D", "06D", "07D",
+        "01E", "02E", "03E", "04E", "05E", "06E", "07E",
+    ]
+    # fmt: on
+    context = Context(booked_seats=booked_seats)
+    ticket_office = AsyncTicketOffice(client=FakeAsyncClient(context.fake_client))
+
+    with pytest.raises(NotEnoughFreeSeats):
+        asyncio.run(ticket_office.reserve(context.train_id, 3))
+
+
+FULL_TRAIN = [f"{n:02}{c}" for c in "ABCDE" for n in range(1, 8)]
+
+
+def test_reserve_with_prefetched_booking_reference() -> None:
+    context = Context(booked_seats=["01A", "02A"])
+    context.ticket_office = TicketOffice(
+        client=context.fake_client, prefetch_booking_reference=True
+    )
+
+    reservation = context.reserve(4)
+
+    assert reservation.booking_reference == BookingReference("new")
+    check_reservation(reservation, train=context.train, seat_count=4)
+
+
+def test_unused_prefetched_booking_references_are_reused() -> None:
+    context = Context(booked_seats=FULL_TRAIN)
+    ticket_office = TicketOffice(
+        client=context.fake_client, prefetch_booking_reference=True
+    )
+    context.ticket_office = ticket_office
+
+    with pytest.raises(NotEnoughFreeSeats):
+        context.reserve(3)
+    assert len(ticket_office.spare_booking_references) == 1
+
+    context.train = make_empty_train(context.train_id)
+    context.fake_client.set_train(context.train)
+    context.fake_client.set_booking_reference(BookingReference("unused"))
+    reservation = ticket_office.reserve(context.train_id, 3)
+
+    assert reservation.booking_reference == BookingReference("new")
+    assert len(ticket_office.spare_booking_references) == 0
+
+
+def test_prefetched_booking_references_are_kept_on_errors(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def choose_seats(train: Occupancy, seat_count: int) -> list[SeatId]:
+        raise RuntimeError("something went wrong")
+
+    monkeypatch.setattr(ticket_office_module, "choose_seats", choose_seats)
+    context = Context(booked_seats=[])
+    ticket_office = TicketOffice(
+        client=context.fake_client, prefetch_booking_reference=True
+    )
+    context.ticket_office = ticket_office
+
+    with pytest.raises(RuntimeError):
+        context.reserve(3)
+    ticket_office.close()
+
+    assert len(ticket_office.spare_booking_references) == 1
+
+
+def test_spare_booking_references_are_kept_on_errors(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    context = Context(booked_seats=[])
+    ticket_office = TicketOffice(
+        client=context.fake_client, prefetch_booking_reference=True
+    )
+    ticket_office.spare_booking_references.put(BookingReference("spare"))
+
+    def get_train(train_id: TrainId) -> Train:
+        raise RuntimeError("train_data is down")
+
+    monkeypatch.setattr(context.fake_client, "get_train", get_train)
+
+    with pytest.raises(RuntimeError):
+        ticket_office.reserve(context.train_id, 3)
+    ticket_office.close()
+
+    assert ticket_office.spare_booking_references.take() == BookingReference("spare")
+
+
+def test_prefetched_booking_references_are_kept_on_errors_asynchronously(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def choose_seats(train: Occupancy, seat_count: int) -> list[SeatId]:
+        raise RuntimeError("something went wrong")
+
+    monkeypatch.setattr(ticket_office_module, "choose_seats", choose_seats)
+    context = Context(booked_seats=[])
+    context.fake_client.set_booking_reference(BookingReference("new"))
+    ticket_office = AsyncTicketOffice(
+        client=FakeAsyncClient(context.fake_client), prefetch_booking_reference=True
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(ticket_office.reserve(context.train_id, 3))
+
+    assert len(ticket_office.spare_booking_references) == 1
+
+
+def test_reserve_asynchronously_with_prefetched_booking_reference() -> None:
+    context = Context(booked_seats=FULL_TRAIN)
+    context.fake_client.set_booking_reference(BookingReference("new"))
+    ticket_office = AsyncTicketOffice(
+        client=FakeAsyncClient(context.fake_client), prefetch_booking_reference=True
+    )
+
+    with pytest.raises(NotEnoughFreeSeats):
+        asyncio.run(ticket_office.reserve(context.train_id, 3))
+    assert len(ticket_office.spare_booking_references) == 1
+
+    context.train = make_empty_train(context.train_id)
+    context.fake_client.set_train(context.train)
+    reservation = asyncio.run(ticket_office.reserve(context.train_id, 3))
+
+    assert len(ticket_office.spare_booking_references) == 0
+    check_reservation(reservation, train=context.train, seat_count=3)
+
+
+class ConflictingClient(FakeClient):
+    """
+    Someone else books `conflicting_seats` just before each of the
+    first `conflict_count` reservations
+    """
+
+    def __init__(self, conflicting_seats: list[str], conflict_count: int) -> None:
+        super().__init__()
+        self.conflicting_seats = [SeatId.parse(s) for s in conflicting_seats]
+        self.conflict_count = conflict_count
+
+    def make_reservation(self, reservation: Reservation) -> None:
+        assert self.train
+        if self.conflict_count:
+            self.conflict_count -= 1
+            self.train.book(self.conflicting_seats, BookingReference("other"))
+            self.train.version = (self.train.version or 0) + 1
+        super().make_reservation(reservation)
+
+
+def test_retry_with_fresh_data_when_the_train_changed() -> None:
+    client = ConflictingClient(["01A", "02A", "03A", "04A"], conflict_count=1)
+    train = make_empty_train(TrainId("express_2000"))
+    train.version = 1
+    client.set_train(train)
+    client.set_booking_reference(BookingReference("new"))
+    ticket_office = TicketOffice(client=client, retry_delay=0)
+
+    reservation = ticket_office.reserve(train.id, 4)
+
+    assert [str(s) for s in reservation.seats] == ["1B", "2B", "3B", "4B"]
+    assert reservation.train_version == 2
+    assert client.get_train_calls == 2
+    check_reservation(reservation, train=train, seat_count=4)
+
+
+def test_give_up_after_too_many_conflicts() -> None:
+    client = ConflictingClient(["01A"], conflict_count=3)
+    train = make_empty_train(TrainId("express_2000"))
+    train.version = 1
+    client.set_train(train)
+    client.set_booking_reference(BookingReference("new"))
+    ticket_office = TicketOffice(client=client, max_attempts=2, retry_delay=0)
+
+    with pytest.raises(ReservationConflict):
+        ticket_office.reserve(train.id, 4)
+    assert client.get_train_calls == 2
+    assert len(ticket_office.spare_booking_references) == 1
+
+
+def test_backoff_delay_grows_with_attempts() -> None:
+    for _ in range(100):
+        assert 0 <= backoff_delay(1, base=0.01) <= 0.02
+        assert 0 <= backoff_delay(3, base=0.01) <= 0.08
+
+
 def check_reservation(
     reservation: Reservation,
     *,
@@ -189,3 +399,25 @@ def check_reservation(
             f"Not enough room in coach {coach} : {train.seats_in_coach(coach)}.\n"
             f"Reservation was:\n{reservation}"
         )
+
+
+def test_reserve_seats_from_a_compact_train() -> None:
+    context = Context(booked_seats=["01A", "02A"])
+    train = CompactTrain(id=context.train_id, seats=context.train.seats())
+    context.train = train
+    context.fake_client.set_train(train)
+
+    reservation = context.reserve(4)
+
+    assert [str(s) for s in reservation.seats] == ["3A", "4A", "5A", "6A"]
+    check_reservation(reservation, train=train, seat_count=4)
+
+
+def test_reserve_seats_from_occupancy_summary() -> None:
+    context = Context(booked_seats=["01A", "02A", "03A", "04A", "05A", "06A"])
+    context.ticket_office.use_occupancy_summary = True
+
+    reservation = context.reserve(4)
+
+    assert [str(s) for s in reservation.seats] == ["1B", "2B", "3B", "4B"]
+    check_reservation(reservation, train=context.train, seat_count=4)
@@ -0,0 +1,74 @@
+import time
+from typing import Callable, Iterator
+
+import pytest
+
+from ticket_office.domain.reservation import BookingReference, SeatId, Train, TrainId
+from ticket_office.infra.caching_client import CachingClient
+from ticket_office.infra.train_watcher import TrainWatcher
+
+from .helpers import FakeClient
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def caching_client(fake_client: FakeClient) -> CachingClient:
+    return CachingClient(fake_client, ttl=60)
+
+
+@pytest.fixture
+def watcher(caching_client: CachingClient) -> Iterator[TrainWatcher]:
+    watcher = TrainWatcher(caching_client, timeout=0.01)
+    yield watcher
+    watcher.stop()
+
+
+def test_cached_trains_are_watched(
+    train_id: TrainId, caching_client: CachingClient, watcher: TrainWatcher
+) -> None:
+    caching_client.get_train(train_id)
+
+    assert watcher.watched_trains() == [train_id]
+
+
+def test_changes_are_applied_to_the_cached_train(
+    train_id: TrainId,
+    train: Train,
+    fake_client: FakeClient,
+    caching_client: CachingClient,
+    watcher: TrainWatcher,
+) -> None:
+    caching_client.get_train(train_id)
+    seat_id = SeatId.parse("01A")
+    changed = train.copy()
+    changed.book([seat_id], BookingReference("123"))
+    fake_client.set_train(changed)
+
+    wait_until(lambda: not caching_client.get_train(train_id).is_free(seat_id))
+
+
+def test_trains_are_no_longer_watched_once_evicted(
+    train_id: TrainId, caching_client: CachingClient, watcher: TrainWatcher
+) -> None:
+    caching_client.get_train(train_id)
+
+    caching_client.invalidate(train_id)
+
+    wait_until(lambda: watcher.watched_trains() == [])
+
+
+def test_number_of_watched_trains_is_limited(caching_client: CachingClient) -> None:
+    watcher = TrainWatcher(caching_client, timeout=0.01, max_watched=2)
+    try:
+        for n in range(4):
+            caching_client.get_train(TrainId(f"train_{n}"))
+
+        assert len(watcher.watched_trains()) == 2
+    finally:
+        watcher.stop()
@@ -0,0 +1,45 @@
+from ticket_office.infra.ttl_cache import TtlCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire() -> None:
+    clock = FakeClock()
+    cache: TtlCache[str, int] = TtlCache(max_size=2, ttl=10, clock=clock)
+    cache.put("a", 1)
+
+    clock.now = 9
+    assert cache.get("a") == 1
+
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.get_stale("a") == 1
+
+
+def test_least_recently_used_entries_are_evicted() -> None:
+    cache: TtlCache[str, int] = TtlCache(max_size=2, ttl=10, clock=FakeClock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_pop() -> None:
+    cache: TtlCache[str, int] = TtlCache(max_size=2, ttl=10, clock=FakeClock())
+    cache.put("a", 1)
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert cache.get_stale("a") is None
@@ -0,0 +1,73 @@
+import struct
+
+import pytest
+
+from ticket_office.domain.compact_train import NO_SEAT, CompactTrain
+from ticket_office.domain.reservation import (
+    BookingReference,
+    CoachId,
+    SeatId,
+    Train,
+    TrainId,
+)
+from ticket_office.infra.wire_format import decode_train, encode_train
+
+# Same as in train_data/test_wire_format.py
+ENCODED = b"".join(
+    [
+        b"TRS1",
+        struct.pack("<II", 3, 1),
+        struct.pack("<H", 3) + b"abc",
+        struct.pack("<H", 2),
+        struct.pack("<H", 1) + b"A",
+        struct.pack("<5H", 4, NO_SEAT, 1, NO_SEAT, 0),
+        struct.pack("<H", 1) + b"B",
+        struct.pack("<3H", 2, NO_SEAT, 1),
+    ]
+)
+
+
+def test_decode_train(train_id: TrainId) -> None:
+    train = decode_train(train_id, ENCODED)
+
+    assert train.version == 3
+    assert train.coaches() == [CoachId("A"), CoachId("B")]
+    assert train.booking_reference(SeatId.parse("01A")) == BookingReference("abc")
+    assert train.booking_reference(SeatId.parse("01B")) == BookingReference("abc")
+    assert train.is_free(SeatId.parse("03A"))
+    assert train.occupancy() == 2 / 3
+
+
+def test_encode_train(train_id: TrainId) -> None:
+    train = decode_train(train_id, ENCODED)
+
+    assert encode_train(train) == ENCODED
+
+
+def test_round_trip(train: Train) -> None:
+    train.book([SeatId.parse("01A"), SeatId.parse("05C")], BookingReference("123"))
+    compact = CompactTrain(id=train.id, seats=train.seats(), version=2)
+
+    decoded = decode_train(train.id, encode_train(compact))
+
+    assert sorted(decoded.seats(), key=lambda s: s.id) == sorted(
+        train.seats(), key=lambda s: s.id
+    )
+    assert decoded.first_free_seats(CoachId("A"), 2) == train.first_free_seats(
+        CoachId("A"), 2
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"",
+        b"{}",
+        ENCODED[:-1],
+        ENCODED.replace(struct.pack("<3H", 2, NO_SEAT, 1), struct.pack("<3H", 2, 0, 2)),
+    ],
+    ids=["empty", "json", "truncated", "unknown reference"],
+)
+def test_invalid_compact_train(train_id: TrainId, content: bytes) -> None:
+    with pytest.raises(ValueError):
+        decode_train(train_id, content)
@@ -0,0 +1,87 @@
+import threading
+from concurrent.futures import Future
+from typing import Iterator
+
+from ticket_office.domain.reservation import Reservation, TrainId
+from ticket_office.domain.ticket_office import TicketOffice
+
+
+class Batch:
+    def __init__(self) -> None:
+        self.requests: list[tuple[int, Future[Reservation]]] = []
+        self.closed = threading.Event()
+
+
+class BatchingTicketOffice:
+    """
+    Same interface as TicketOffice, but reservations for the same train
+    made within `window` seconds of each other are grouped and handled by
+    TicketOffice.reserve_many(), so that the train is fetched once per batch
+    and the seats are allocated without conflicts.
+
+    The first caller of a batch waits for the window to end (or for the
+    batch to reach `max_batch_size`) then processes the whole batch, the
+    other callers just wait for their result
+    """
+
+    def __init__(
+        self,
+        ticket_office: TicketOffice,
+        *,
+        window: float = 0.005,
+        max_batch_size: int = 64,
+    ) -> None:
+        self.ticket_office = ticket_office
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._open_batches: dict[TrainId, Batch] = {}
+
+    def reserve(self, train_id: TrainId, seat_count: int) -> Reservation:
+        future: Future[Reservation] = Future()
+        with self._lock:
+            batch = self._open_batches.get(train_id)
+            is_leader = batch is None
+            if batch is None:
+                batch = self._open_batches[train_id] = Batch()
+            batch.requests.append((seat_count, future))
+            if len(batch.requests) >= self.max_batch_size:
+                self._close(train_id, batch)
+
+        if is_leader:
+            batch.closed.wait(self.window)
+            with self._lock:
+                self._close(train_id, batch)
+            self._process(train_id, batch)
+
+        return future.result()
+
+    def reserve_many(
+        self, train_id: TrainId, seat_counts: list[int]
+    ) -> Iterator[Reservation | Exception]:
+        # Already a batch: no need to wait for other reservations
+        return self.ticket_office.reserve_many(train_id, seat_counts)
+
+    def _close(self, train_id: TrainId, batch: Batch) -> None:
+        # Note: must be called with self._lock held
+        if self._open_batches.get(train_id) is batch:
+            del self._open_batches[train_id]
+        batch.closed.set()
+
+    def _process(self, train_id: TrainId, batch: Batch) -> None:
+        seat_counts = [seat_count for seat_count, _ in batch.requests]
+        futures = [future for _, future in batch.requests]
+        done = 0
+        try:
+            results = self.ticket_office.reserve_many(train_id, seat_counts)
+            for result in results:
+                if isinstance(result, Exception):
+                    futures[done].set_exception(result)
+                else:
+                    futures[done].set_result(result)
+                done += 1
+        except BaseException as e:
+            for future in futures[done:]:
+                future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
@@ -1,5 +1,7 @@
 import abc
+import time
 
+from ticket_office.domain.occupancy import OccupancySummary
 from ticket_office.domain.reservation import (
     BookingReference,
     Reservation,
@@ -13,10 +15,80 @@ class Client(metaclass=abc.ABCMeta):
     def get_train(self, train_id: TrainId) -> Train:
         pass
 
+    def refresh_train(self, train: Train) -> Train:
+        """
+        Return an up-to-date version of the given train.
+
+        By default, the whole train is fetched again, but implementations
+        may have cheaper ways to check whether it changed
+        """
+        return self.get_train(train.id)
+
+    def wait_for_changes(self, train: Train, timeout: float) -> Train:
+        """
+        Return an up-to-date version of the given train, as soon as it
+        changes, or after `timeout` seconds if it does not.
+
+        By default, this waits for `timeout` seconds, then calls
+        refresh_train(), but implementations may be notified of changes
+        """
+        time.sleep(timeout)
+        return self.refresh_train(train)
+
+    def get_occupancy_summary(
+        self, train_id: TrainId, free_seat_count: int
+    ) -> OccupancySummary:
+        """
+        Return the occupancy of each coach of the train, with at most
+        `free_seat_count` free seats per coach.
+
+        By default, this is computed from the whole train, but
+        implementations may be able to fetch only the summary
+        """
+        train = self.get_train(train_id)
+        return OccupancySummary.for_train(train, free_seat_count)
+
     @abc.abstractmethod
     def get_booking_reference(self) -> BookingReference:
         pass
 
+    def get_booking_references(self, count: int) -> list[BookingReference]:
+        """
+        Return at most `count` new booking references - and at least one.
+
+        By default, get_booking_reference() is called `count` times, but
+        implementations may be able to get them all at once
+        """
+        return [self.get_booking_reference() for _ in range(count)]
+
     @abc.abstractmethod
     def make_reservation(self, reservation: Reservation) -> None:
+        """
+        Raise ReservationConflict if some of the seats are already booked,
+        or if the train changed since reservation.train_version
+        """
+
+
+class AsyncClient(metaclass=abc.ABCMeta):
+    """
+    Same as Client, but every method is a coroutine
+    """
+
+    @abc.abstractmethod
+    async def get_train(self, train_id: TrainId) -> Train:
+        pass
+
+    @abc.abstractmethod
+    async def get_booking_reference(self) -> BookingReference:
         pass
+
+    @abc.abstractmethod
+    async def make_reservation(self, reservation: Reservation) -> None:
+        pass
+
+
+class ReservationConflict(Exception):
+    """
+    Raised when a reservation cannot be made because the train changed
+    in the meantime. Retrying with fresh data may succeed
+    """
@@ -0,0 +1,285 @@
+from array import array
+from typing import Iterable
+
+from ticket_office.domain.reservation import (
+    AlreadyBooked,
+    BookingReference,
+    CoachId,
+    Seat,
+    SeatId,
+    SeatNotFound,
+    SeatNumber,
+    Train,
+    TrainId,
+)
+
+# Values stored in the per-coach arrays. Anything else is an index
+# in CompactTrain._references, shifted by one
+NO_SEAT = 0xFFFF
+FREE = 0
+
+
+class CompactTrain(Train):
+    """
+    Same as Train, but uses a lot less memory for large trains.
+
+    Instead of one Seat object per seat, each coach is stored as an array
+    of unsigned shorts indexed by seat number, and booking references are
+    stored once in an interned table.
+
+    Note that the Seat objects returned by seats(), seats_in_coach() and
+    first_free_seats() are built on demand - booking them directly has no
+    effect on the train, use CompactTrain.book() instead.
+
+    Invariants:
+        * self._slots[coach_id][n] is NO_SEAT if there is no seat with
+          number n in the coach, FREE if the seat is free, and i + 1 if the
+          seat is booked with self._references[i]
+        * self._first_free[coach_id] is less than or equal to the number of
+          the first free seat in the coach
+        * the counters inherited from Train are kept up to date
+    """
+
+    def __init__(
+        self, *, id: TrainId, seats: Iterable[Seat], version: int | None = None
+    ) -> None:
+        self.id = id
+        self.version = version
+        self._coaches: set[CoachId] = set()
+        self._seats_in_coach: dict[CoachId, int] = {}
+        self._occupied_in_coach: dict[CoachId, int] = {}
+        self._occupied_count = 0
+        self._seat_count = 0
+        self._shared = False
+        self._slots: dict[CoachId, array[int]] = {}
+        self._first_free: dict[CoachId, int] = {}
+        self._references: list[BookingReference] = []
+        self._reference_index: dict[BookingReference, int] = {}
+        self._add_rows((s.coach_id, s.number, s.booking_reference) for s in seats)
+
+    @classmethod
+    def from_rows(
+        cls,
+        *,
+        id: TrainId,
+        rows: Iterable[tuple[CoachId, SeatNumber, BookingReference | None]],
+        version: int | None = None,
+    ) -> "CompactTrain":
+        """
+        Build a train from (coach id, seat number, booking reference) tuples,
+        without going through Seat objects
+        """
+        res = cls(id=id, seats=[], version=version)
+        res._add_rows(rows)
+        return res
+
+    @classmethod
+    def from_slots(
+        cls,
+        *,
+        id: TrainId,
+        slots: dict[CoachId, "array[int]"],
+        references: list[BookingReference],
+        version: int | None = None,
+    ) -> "CompactTrain":
+        """
+        Build a train directly from its per-coach arrays (see the class
+        docstring for their meaning) and its booking references.
+
+        Raise ValueError if the slots refer to unknown booking references
+        """
+        res = cls(id=id, seats=[], version=version)
+        res._references = list(references)
+        res._reference_index = {r: i for i, r in enumerate(references, start=1)}
+        for coach_id, coach_slots in slots.items():
+            values = set(coach_slots)
+            values.discard(NO_SEAT)
+            if values and max(values) > len(references):
+                raise ValueError(f"Unknown booking reference in coach {coach_id}")
+            seat_count = len(coach_slots) - coach_slots.count(NO_SEAT)
+            occupied_count = seat_count - coach_slots.count(FREE)
+            res._slots[coach_id] = coach_slots
+            res._first_free[coach_id] = 0
+            res._coaches.add(coach_id)
+            res._seats_in_coach[coach_id] = seat_count
+            res._occupied_in_coach[coach_id] = occupied_count
+            res._seat_count += seat_count
+            res._occupied_count += occupied_count
+        return res
+
+    def to_slots(
+        self,
+    ) -> tuple[dict[CoachId, "array[int]"], list[BookingReference]]:
+        """
+        Inverse of from_slots(): return a copy of the per-coach arrays and of
+        the booking references
+        """
+        slots = {coach_id: array("H", s) for coach_id, s in self._slots.items()}
+        return slots, list(self._references)
+
+    def _add_rows(
+        self, rows: Iterable[tuple[CoachId, SeatNumber, BookingReference | None]]
+    ) -> None:
+        by_coach: dict[CoachId, list[tuple[int, BookingReference | None]]] = {}
+        for coach_id, number, booking_reference in rows:
+            coach_rows = by_coach.get(coach_id)
+            if coach_rows is None:
+                coach_rows = by_coach[coach_id] = []
+            coach_rows.append((number.value, booking_reference))
+        for coach_id, coach_rows in by_coach.items():
+            self._add_coach(coach_id, coach_rows)
+
+    def _add_coach(
+        self, coach_id: CoachId, rows: list[tuple[int, BookingReference | None]]
+    ) -> None:
+        # Note: coaches are always added in one go, see _add_rows()
+        size = max(position for position, _ in rows) + 1
+        slots = self._slots[coach_id] = array("H", [NO_SEAT]) * size
+        self._first_free[coach_id] = 0
+        seat_count = 0
+        occupied_count = 0
+        for position, booking_reference in rows:
+            if slots[position] != NO_SEAT:
+                # Duplicated seat id: keep the first one
+                continue
+            seat_count += 1
+            if booking_reference is None:
+                slots[position] = FREE
+            else:
+                slots[position] = self._intern(booking_reference)
+                occupied_count += 1
+        self._coaches.add(coach_id)
+        self._seats_in_coach[coach_id] = seat_count
+        self._occupied_in_coach[coach_id] = occupied_count
+        self._seat_count += seat_count
+        self._occupied_count += occupied_count
+
+    def _intern(self, booking_reference: BookingReference) -> int:
+        index = self._reference_index.get(booking_reference)
+        if index is None:
+            self._references.append(booking_reference)
+            index = self._reference_index[booking_reference] = len(self._references)
+        return index
+
+    def _slot(self, seat_id: SeatId) -> int:
+        slots = self._slots.get(seat_id.coach_id)
+        position = seat_id.number.value
+        if slots is None or position >= len(slots):
+            return NO_SEAT
+        return slots[position]
+
+    def _reference_for_slot(self, slot: int) -> BookingReference | None:
+        if slot == FREE:
+            return None
+        return self._references[slot - 1]
+
+    def _seat(self, coach_id: CoachId, position: int, slot: int) -> Seat:
+        return Seat(
+            number=SeatNumber(position),
+            coach_id=coach_id,
+            booking_reference=self._reference_for_slot(slot),
+        )
+
+    def booking_reference(self, seat_id: SeatId) -> BookingReference | None:
+        slot = self._slot(seat_id)
+        if slot == NO_SEAT:
+            return None
+        return self._reference_for_slot(slot)
+
+    def is_free(self, seat_id: SeatId) -> bool:
+        slot = self._slot(seat_id)
+        if slot == NO_SEAT:
+            raise SeatNotFound(seat_id, train_id=self.id)
+        return slot == FREE
+
+    def _unshare(self) -> None:
+        if not self._shared:
+            return
+        self._slots = {coach_id: s[:] for coach_id, s in self._slots.items()}
+        self._first_free = dict(self._first_free)
+        self._references = list(self._references)
+        self._reference_index = dict(self._reference_index)
+        self._coaches = set(self._coaches)
+        self._seats_in_coach = dict(self._seats_in_coach)
+        self._occupied_in_coach = dict(self._occupied_in_coach)
+        self._shared = False
+
+    def book(self, seats: list[SeatId], booking_reference: BookingReference) -> None:
+        self._unshare()
+        for seat_id in seats:
+            slot = self._slot(seat_id)
+            if slot == NO_SEAT:
+                raise SeatNotFound(seat_id, train_id=self.id)
+            if slot == FREE:
+                coach_id = seat_id.coach_id
+                self._slots[coach_id][seat_id.number.value] = self._intern(
+                    booking_reference
+                )
+                self._record_booking(coach_id)
+                continue
+            current_booking_reference = self._references[slot - 1]
+            if current_booking_reference != booking_reference:
+                raise AlreadyBooked(
+                    seat_id, current_booking_reference, booking_reference
+                )
+
+    def update_seats(self, seats: list[Seat], *, version: int | None) -> None:
+        self._unshare()
+        for seat in seats:
+            slot = self._slot(seat.id)
+            if slot == NO_SEAT:
+                raise SeatNotFound(seat.id, train_id=self.id)
+            coach_id = seat.coach_id
+            position = seat.number.value
+            if seat.booking_reference:
+                new_slot = self._intern(seat.booking_reference)
+                if slot == FREE:
+                    self._record_booking(coach_id)
+            else:
+                new_slot = FREE
+                if slot != FREE:
+                    self._record_release(coach_id)
+                    self._first_free[coach_id] = min(
+                        self._first_free[coach_id], position
+                    )
+            self._slots[coach_id][position] = new_slot
+        self.version = version
+
+    def seats(self) -> list[Seat]:
+        res = []
+        for coach_id in self._slots:
+            res.extend(self.seats_in_coach(coach_id))
+        return res
+
+    def seats_in_coach(self, coach_id: CoachId) -> list[Seat]:
+        slots = self._slots.get(coach_id, array("H"))
+        return [
+            self._seat(coach_id, position, slot)
+            for position, slot in enumerate(slots)
+            if slot != NO_SEAT
+        ]
+
+    def first_free_seats(self, coach_id: CoachId, count: int) -> list[Seat]:
+        """
+        Return at most `count` free seats in the given coach, ordered by
+        seat number
+
+        The position of the first free seat is remembered (and lowered when
+        a seat is released, see update_seats()), so the scan starts from there
+        """
+        slots = self._slots.get(coach_id)
+        if slots is None:
+            return []
+        res: list[Seat] = []
+        start = self._first_free[coach_id]
+        for position in range(start, len(slots)):
+            if slots[position] != FREE:
+                continue
+            if not res:
+                self._first_free[coach_id] = position
+            if len(res) == count:
+                return res
+            res.append(self._seat(coach_id, position, FREE))
+        if not res:
+            self._first_free[coach_id] = len(slots)
+        return res
@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+
+from typing_extensions import Protocol
+
+from ticket_office.domain.reservation import CoachId, Seat, SeatId, Train, TrainId
+
+
+class Occupancy(Protocol):
+    """
+    What is needed to choose seats in a train - see choose_seats().
+
+    Implemented by Train, and by OccupancySummary when the seats themselves
+    are not known
+    """
+
+    @property
+    def id(self) -> TrainId:
+        pass
+
+    @property
+    def version(self) -> int | None:
+        pass
+
+    def coaches(self) -> list[CoachId]:
+        pass
+
+    def occupancy_for_coach_after_booking(
+        self, coach_id: CoachId, seat_count: int
+    ) -> float:
+        pass
+
+    def occupancy_after_booking(self, seat_count: int) -> float:
+        pass
+
+    def first_free_seats(self, coach_id: CoachId, count: int) -> list[Seat]:
+        pass
+
+
+@dataclass(frozen=True)
+class CoachOccupancy:
+    seat_count: int
+    booked_count: int
+    # Ordered by seat number - may only contain the first free seats
+    # of the coach
+    free_seats: list[SeatId]
+
+
+@dataclass(frozen=True)
+class OccupancySummary:
+    """
+    Number of seats and of booked seats for each coach of a train, along
+    with the first free seats of each coach.
+
+    first_free_seats() only knows about the free seats in `coaches`, so
+    the summary must be built with enough free seats per coach for the
+    reservation being planned
+    """
+
+    id: TrainId
+    coaches_by_id: dict[CoachId, CoachOccupancy]
+    version: int | None = None
+
+    @classmethod
+    def for_train(cls, train: Train, free_seat_count: int) -> "OccupancySummary":
+        coaches_by_id = {}
+        for coach_id in train.coaches():
+            # Note: only uses the counters of the train, without going
+            # through all its seats
+            free_seats = train.first_free_seats(coach_id, free_seat_count)
+            coaches_by_id[coach_id] = CoachOccupancy(
+                seat_count=train.seat_count_in_coach(coach_id),
+                booked_count=train.booked_count_in_coach(coach_id),
+                free_seats=[s.id for s in free_seats],
+            )
+        return cls(id=train.id, coaches_by_id=coaches_by_id, version=train.version)
+
+    def coaches(self) -> list[CoachId]:
+        return sorted(self.coaches_by_id)
+
+    def occupancy_for_coach_after_booking(
+        self, coach_id: CoachId, seat_count: int
+    ) -> float:
+        coach = self.coaches_by_id[coach_id]
+        return (coach.booked_count + seat_count) / coach.seat_count
+
+    def occupancy_after_booking(self, seat_count: int) -> float:
+        coaches = self.coaches_by_id.values()
+        booked_count = sum(c.booked_count for c in coaches)
+        seat_count_in_train = sum(c.seat_count for c in coaches)
+        return (booked_count + seat_count) / seat_count_in_train
+
+    def first_free_seats(self, coach_id: CoachId, count: int) -> list[Seat]:
+        coach = self.coaches_by_id.get(coach_id)
+        if not coach:
+            return []
+        return [Seat.free_seat_with_id(id) for id in coach.free_seats[:count]]
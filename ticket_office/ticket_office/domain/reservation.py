@@ -1,7 +1,11 @@
+import copy
+import dataclasses
+import itertools
 from dataclasses import dataclass
 from functools import total_ordering
+from typing import Any, ClassVar
 
-from ticket_office.domain.value_object import ValueObject
+from ticket_office.domain.value_object import InternedValueObject, ValueObject
 
 
 class BookingReference(ValueObject[str]):
@@ -10,23 +14,47 @@ class BookingReference(ValueObject[str]):
             raise ValueError("BookingReference cannot be empty")
 
 
-class SeatNumber(ValueObject[int]):
+class SeatNumber(InternedValueObject[int]):
     def validate(self, value: int) -> None:
         if value <= 0 or value > 100:
             raise ValueError("Seat number must be between 1 and 99")
 
 
-class CoachId(ValueObject[str]):
+class CoachId(InternedValueObject[str]):
     def validate(self, value: str) -> None:
         if value not in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
             raise ValueError("Coach ID should be one uppercase letter")
 
 
 @total_ordering
-@dataclass(frozen=True)
 class SeatId:
+    """
+    Like CoachId and SeatNumber, seat ids are interned: there is only one
+    SeatId instance for a given coach and seat number
+    """
+
+    __slots__ = ("number", "coach_id", "sort_key", "_hash")
+
+    _instances: ClassVar[dict[tuple[SeatNumber, CoachId], "SeatId"]] = {}
+
     number: SeatNumber
     coach_id: CoachId
+    # Seat ids are sorted by their string representation, like "10A" < "2A",
+    # as they were before being interned
+    sort_key: str
+    _hash: int
+
+    def __new__(cls, number: SeatNumber, coach_id: CoachId) -> "SeatId":
+        key = (number, coach_id)
+        res = cls._instances.get(key)
+        if res is None:
+            res = super().__new__(cls)
+            object.__setattr__(res, "number", number)
+            object.__setattr__(res, "coach_id", coach_id)
+            object.__setattr__(res, "sort_key", f"{number}{coach_id}")
+            object.__setattr__(res, "_hash", hash(key))
+            res = cls._instances.setdefault(key, res)
+        return res
 
     @classmethod
     def parse(cls, value: str) -> "SeatId":
@@ -36,11 +64,27 @@ class SeatId:
         coach_id = CoachId(value[2])
         return cls(number, coach_id)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("SeatId is immutable")
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (self.__class__, (self.number, self.coach_id))
+
+    def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, SeatId):
+            return False
+        return self.sort_key == other.sort_key
+
+    def __hash__(self) -> int:
+        return self._hash
+
     def __lt__(self, other: "SeatId") -> bool:
-        return str(self) < str(other)
+        return self.sort_key < other.sort_key
 
     def __str__(self) -> str:
-        return f"{self.number}{self.coach_id}"
+        return self.sort_key
 
     def __repr__(self) -> str:
         return f"SeatId({self})"
@@ -89,22 +133,82 @@ class TrainId(ValueObject[str]):
             raise ValueError("train id should not be blank")
 
 
+@dataclass(frozen=True)
+class Reservation:
+    """
+    When `train_version` is set, the reservation should only be made if the
+    train did not change since that version
+    """
+
+    train: TrainId
+    seats: list[SeatId]
+    booking_reference: BookingReference
+    train_version: int | None = None
+
+    def __str__(self) -> str:
+        return f"Reservation(reference={self.booking_reference}, train={self.train}, seats={[str(i) for i in self.seats]})"
+
+
 class Train:
     """
     For the purpose of reservation, a train is a fixed collection of seats.
+
+    `version` is the version of the train in the train data service, if
+    known - it is incremented each time a reservation is made on the train.
+
     Invariants:
         * no two seats have the same id
-        * self._caches contains the list of all the coach ids
+        * self._coaches contains the list of all the coach ids
+        * self._occupied_in_coach and self._seats_in_coach hold the number of
+          booked and total seats for each coach, and self._occupied_count and
+          self._seat_count the same numbers for the whole train - so that
+          occupancy queries do not have to go through every seat
+        * self._free_seats_in_coach contains the free seats of each coach,
+          ordered by seat number
+        * when self._shared is True, the seats and the counters may be
+          shared with copies of the train, and must be copied before being
+          modified - see copy()
     """
 
-    def __init__(self, *, id: TrainId, seats: list[Seat]) -> None:
+    def __init__(
+        self, *, id: TrainId, seats: list[Seat], version: int | None = None
+    ) -> None:
         self.id = id
+        self.version = version
         self._seats: dict[SeatId, Seat] = {}
         self._coaches: set[CoachId] = set()
+        self._seats_in_coach: dict[CoachId, int] = {}
+        self._occupied_in_coach: dict[CoachId, int] = {}
+        self._occupied_count = 0
+        self._seat_count = 0
+        self._shared = False
+        self._free_seats_in_coach: dict[CoachId, dict[SeatId, Seat]] = {}
         for seat in seats:
             coach_id = seat.coach_id
             self._seats[seat.id] = seat
+            self._record_seat(coach_id)
+            if not seat.is_free:
+                self._record_booking(coach_id)
+        for seat in sorted(seats, key=lambda s: s.number):
+            if seat.is_free:
+                free_seats = self._free_seats_in_coach.setdefault(seat.coach_id, {})
+                free_seats[seat.id] = seat
+
+    def _record_seat(self, coach_id: CoachId) -> None:
+        if coach_id not in self._coaches:
             self._coaches.add(coach_id)
+            self._seats_in_coach[coach_id] = 0
+            self._occupied_in_coach[coach_id] = 0
+        self._seats_in_coach[coach_id] += 1
+        self._seat_count += 1
+
+    def _record_booking(self, coach_id: CoachId) -> None:
+        self._occupied_in_coach[coach_id] += 1
+        self._occupied_count += 1
+
+    def _record_release(self, coach_id: CoachId) -> None:
+        self._occupied_in_coach[coach_id] -= 1
+        self._occupied_count -= 1
 
     def booking_reference(self, seat_id: SeatId) -> BookingReference | None:
         seat = self._seats.get(seat_id)
@@ -123,9 +227,75 @@ class Train:
         return seat.is_free
 
     def book(self, seats: list[SeatId], booking_reference: BookingReference) -> None:
+        self._unshare()
         for seat_id in seats:
             seat = self._get_seat(seat_id)
+            was_free = seat.is_free
             seat.book(booking_reference)
+            if was_free:
+                del self._free_seats_in_coach[seat.coach_id][seat_id]
+                self._record_booking(seat.coach_id)
+
+    def record_reservation(self, reservation: Reservation) -> None:
+        """
+        Book the seats of a reservation that was accepted by the train data
+        service.
+
+        If the reservation was made against this version of the train, the
+        train now matches the next version
+        """
+        self.book(reservation.seats, reservation.booking_reference)
+        if self.version is not None and reservation.train_version == self.version:
+            self.version += 1
+
+    def update_seats(self, seats: list[Seat], *, version: int | None) -> None:
+        """
+        Overwrite the booking references of some seats with the ones
+        from the train data service - unlike book(), seats can go from
+        booked to free, when the train is reset
+        """
+        self._unshare()
+        released_in: set[CoachId] = set()
+        for seat in seats:
+            current = self._get_seat(seat.id)
+            coach_id = current.coach_id
+            if current.is_free and seat.booking_reference:
+                del self._free_seats_in_coach[coach_id][current.id]
+                self._record_booking(coach_id)
+            elif not current.is_free and not seat.booking_reference:
+                self._record_release(coach_id)
+                released_in.add(coach_id)
+            current.booking_reference = seat.booking_reference
+        for coach_id in released_in:
+            seats_in_coach = sorted(
+                self.seats_in_coach(coach_id), key=lambda s: s.number
+            )
+            self._free_seats_in_coach[coach_id] = {
+                s.id: s for s in seats_in_coach if s.is_free
+            }
+        self.version = version
+
+    def copy(self) -> "Train":
+        """
+        Return a copy of the train. This is cheap: the copy shares its
+        seats with the original until one of them is booked
+        """
+        res = copy.copy(self)
+        self._shared = res._shared = True
+        return res
+
+    def _unshare(self) -> None:
+        if not self._shared:
+            return
+        self._seats = {id: dataclasses.replace(s) for id, s in self._seats.items()}
+        self._free_seats_in_coach = {
+            coach_id: {id: self._seats[id] for id in free_seats}
+            for coach_id, free_seats in self._free_seats_in_coach.items()
+        }
+        self._coaches = set(self._coaches)
+        self._seats_in_coach = dict(self._seats_in_coach)
+        self._occupied_in_coach = dict(self._occupied_in_coach)
+        self._shared = False
 
     def seats(self) -> list[Seat]:
         return list(self._seats.values())
@@ -133,6 +303,14 @@ class Train:
     def seats_in_coach(self, coach_id: CoachId) -> list[Seat]:
         return [s for s in self._seats.values() if s.coach_id == coach_id]
 
+    def first_free_seats(self, coach_id: CoachId, count: int) -> list[Seat]:
+        """
+        Return at most `count` free seats in the given coach, ordered by
+        seat number
+        """
+        free_seats = self._free_seats_in_coach.get(coach_id, {})
+        return list(itertools.islice(free_seats.values(), count))
+
     def coaches(self) -> list[CoachId]:
         return sorted(self._coaches)
 
@@ -140,40 +318,31 @@ class Train:
         seats_in_coach = self.seats_in_coach(coach_id)
         return [s for s in seats_in_coach if not s.is_free]
 
+    def seat_count_in_coach(self, coach_id: CoachId) -> int:
+        return self._seats_in_coach[coach_id]
+
+    def booked_count_in_coach(self, coach_id: CoachId) -> int:
+        return self._occupied_in_coach[coach_id]
+
     def occupancy_for_coach(self, coach_id: CoachId) -> float:
-        seats_in_coach = self.seats_in_coach(coach_id)
-        occupied_seats_in_coach = self.occupied_seats_in_coach(coach_id)
-        return (len(occupied_seats_in_coach)) / len(seats_in_coach)
+        return self._occupied_in_coach[coach_id] / self._seats_in_coach[coach_id]
 
     def occupancy_for_coach_after_booking(
         self, coach_id: CoachId, seat_count: int
     ) -> float:
-        seats_in_coach = self.seats_in_coach(coach_id)
-        occupied_seats_in_coach = self.occupied_seats_in_coach(coach_id)
-        return (len(occupied_seats_in_coach) + seat_count) / len(seats_in_coach)
+        occupied = self._occupied_in_coach[coach_id] + seat_count
+        return occupied / self._seats_in_coach[coach_id]
 
     def occupancy_after_booking(self, seat_count: int) -> float:
-        occupied_seats = [s for s in self._seats.values() if not s.is_free]
-        return (len(occupied_seats) + seat_count) / len(self._seats)
+        return (self._occupied_count + seat_count) / self._seat_count
 
     def occupancy(self) -> float:
-        occupied_seats = [s for s in self._seats.values() if not s.is_free]
-        return len(occupied_seats) / len(self._seats)
+        return self._occupied_count / self._seat_count
 
     def __repr__(self) -> str:
         return f"{self.seats()}"
 
 
-@dataclass(frozen=True)
-class Reservation:
-    train: TrainId
-    seats: list[SeatId]
-    booking_reference: BookingReference
-
-    def __str__(self) -> str:
-        return f"Reservation(reference={self.booking_reference}, train={self.train}, seats={[str(i) for i in self.seats]})"
-
-
 class SeatNotFound(Exception):
     def __init__(self, id: SeatId, train_id: TrainId):
         self.id = id
@@ -1,38 +1,374 @@
-from ticket_office.domain.client import Client
-from ticket_office.domain.reservation import CoachId, Reservation, Train, TrainId
+import asyncio
+import collections
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
+from typing_extensions import Protocol
+
+from ticket_office.domain.client import AsyncClient, Client, ReservationConflict
+from ticket_office.domain.occupancy import Occupancy
+from ticket_office.domain.reservation import (
+    BookingReference,
+    CoachId,
+    Reservation,
+    SeatId,
+    Train,
+    TrainId,
+)
+
+
+class SpareBookingReferences:
+    """
+    Booking references that were fetched but never used in a reservation,
+    so that the next reservations can use them instead of asking for a
+    new one.
+
+    Thread safe
+    """
+
+    def __init__(self) -> None:
+        self._references: collections.deque[BookingReference] = collections.deque()
+
+    def put(self, booking_reference: BookingReference) -> None:
+        self._references.append(booking_reference)
+
+    def take(self) -> BookingReference | None:
+        try:
+            return self._references.popleft()
+        except IndexError:
+            return None
+
+    def __len__(self) -> int:
+        return len(self._references)
+
+
+class Reserver(Protocol):
+    """
+    What is needed to serve reservations - see Server.
+
+    Implemented by TicketOffice, and by BatchingTicketOffice
+    """
+
+    def reserve(self, train_id: TrainId, seat_count: int) -> Reservation:
+        pass
+
+    def reserve_many(
+        self, train_id: TrainId, seat_counts: list[int]
+    ) -> Iterator[Reservation | Exception]:
+        pass
 
 
 class TicketOffice:
-    def __init__(self, *, client: Client) -> None:
+    """
+    When `prefetch_booking_reference` is True, the booking reference is
+    fetched at the same time as the train instead of after the seats have
+    been chosen. References that end up not being used are kept in
+    `self.spare_booking_references` for the next reservations. Call close()
+    to stop the threads fetching them.
+
+    Reservations are only made if the train did not change since it was
+    fetched. If it did, the seats are chosen again with fresh data, up to
+    `max_attempts` times, waiting a random delay between attempts - see
+    backoff_delay()
+
+    When `use_occupancy_summary` is True, seats are chosen from
+    Client.get_occupancy_summary() instead of from the whole train
+    """
+
+    def __init__(
+        self,
+        *,
+        client: Client,
+        prefetch_booking_reference: bool = False,
+        max_attempts: int = 3,
+        retry_delay: float = 0.01,
+        use_occupancy_summary: bool = False,
+    ) -> None:
         self.client = client
+        self.prefetch_booking_reference = prefetch_booking_reference
+        self.use_occupancy_summary = use_occupancy_summary
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.spare_booking_references = SpareBookingReferences()
+        # Note: threads are only started when needed
+        self._executor: ThreadPoolExecutor | None = None
+        if prefetch_booking_reference:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="booking_reference")
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
 
     def reserve(self, train_id: TrainId, seat_count: int) -> Reservation:
-        train = self.client.get_train(train_id)
-        to_reserve = []
+        attempt = 1
+        while True:
+            try:
+                return self._reserve_once(train_id, seat_count)
+            except ReservationConflict:
+                if attempt >= self.max_attempts:
+                    raise
+            time.sleep(backoff_delay(attempt, self.retry_delay))
+            attempt += 1
+
+    def _reserve_once(self, train_id: TrainId, seat_count: int) -> Reservation:
+        if self.prefetch_booking_reference:
+            return self._reserve_with_prefetch(train_id, seat_count)
+
+        train = self._get_occupancy(train_id, seat_count)
+
+        seat_ids = choose_seats(train, seat_count)
+
+        booking_reference = self._get_booking_reference()
+
+        return self._make_reservation(train, seat_ids, booking_reference)
+
+    def _get_occupancy(self, train_id: TrainId, seat_count: int) -> Occupancy:
+        if self.use_occupancy_summary:
+            return self.client.get_occupancy_summary(train_id, seat_count)
+        return self.client.get_train(train_id)
+
+    def reserve_many(
+        self, train_id: TrainId, seat_counts: list[int]
+    ) -> Iterator[Reservation | Exception]:
+        """
+        Make one reservation for each seat count, fetching the train only
+        once.
+
+        Seats are allocated one reservation after the other against the same
+        snapshot of the train, so the reservations never compete for the
+        same seats, and the booking references are fetched in blocks.
+
+        If the train changed in the meantime, it is fetched again and the
+        reservation is retried, like in reserve()
+
+        Yields either the reservation or the exception that prevented it,
+        in the same order as `seat_counts`, as soon as each is done
+        """
+        train = self.client.get_train(train_id).copy()
+        references: collections.deque[BookingReference] = collections.deque()
+        try:
+            for index, seat_count in enumerate(seat_counts):
+                attempt = 1
+                while True:
+                    try:
+                        seat_ids = choose_seats(train, seat_count)
+                        if not references:
+                            remaining = len(seat_counts) - index
+                            references.extend(self._get_booking_references(remaining))
+                        reservation = self._make_reservation(
+                            train, seat_ids, references.popleft()
+                        )
+                    except ReservationConflict as e:
+                        # Otherwise, all the next reservations would conflict too
+                        train = self.client.get_train(train_id).copy()
+                        if attempt >= self.max_attempts:
+                            yield e
+                            break
+                        time.sleep(backoff_delay(attempt, self.retry_delay))
+                        attempt += 1
+                    except Exception as e:
+                        yield e
+                        break
+                    else:
+                        train.record_reservation(reservation)
+                        yield reservation
+                        break
+        finally:
+            for booking_reference in references:
+                self.spare_booking_references.put(booking_reference)
+
+    def _reserve_with_prefetch(self, train_id: TrainId, seat_count: int) -> Reservation:
+        booking_reference = self.spare_booking_references.take()
+        if booking_reference:
+            try:
+                train = self._get_occupancy(train_id, seat_count)
+            except BaseException:
+                self.spare_booking_references.put(booking_reference)
+                raise
+        else:
+            assert self._executor
+            future = self._executor.submit(self.client.get_booking_reference)
+            try:
+                train = self._get_occupancy(train_id, seat_count)
+            except BaseException:
+                future.add_done_callback(self._keep_spare_booking_reference)
+                raise
+            booking_reference = future.result()
 
-        coach = self.find_best_coach(train, seat_count)
-        if not coach or train.occupancy_after_booking(seat_count) >= 0.7:
-            raise NotEnoughFreeSeats()
+        try:
+            seat_ids = choose_seats(train, seat_count)
+        except BaseException:
+            self.spare_booking_references.put(booking_reference)
+            raise
 
-        available_seats = [s for s in train.seats_in_coach(coach) if s.is_free]
-        to_reserve = available_seats[0:seat_count]
+        return self._make_reservation(train, seat_ids, booking_reference)
 
-        booking_reference = self.client.get_booking_reference()
+    def _keep_spare_booking_reference(self, future: Future[BookingReference]) -> None:
+        if not future.cancelled() and not future.exception():
+            self.spare_booking_references.put(future.result())
 
-        seat_ids = [s.id for s in to_reserve]
+    def _get_booking_reference(self) -> BookingReference:
+        spare = self.spare_booking_references.take()
+        if spare:
+            return spare
+        return self.client.get_booking_reference()
+
+    def _get_booking_references(self, count: int) -> list[BookingReference]:
+        references: list[BookingReference] = []
+        while len(references) < count:
+            spare = self.spare_booking_references.take()
+            if not spare:
+                break
+            references.append(spare)
+        if not references:
+            references = self.client.get_booking_references(count)
+        return references
+
+    def _make_reservation(
+        self,
+        train: Occupancy,
+        seat_ids: list[SeatId],
+        booking_reference: BookingReference,
+    ) -> Reservation:
         reservation = Reservation(
-            train=train_id, seats=seat_ids, booking_reference=booking_reference
+            train=train.id,
+            seats=seat_ids,
+            booking_reference=booking_reference,
+            train_version=train.version,
         )
 
-        self.client.make_reservation(reservation)
+        try:
+            self.client.make_reservation(reservation)
+        except ReservationConflict:
+            self.spare_booking_references.put(booking_reference)
+            raise
 
         return reservation
 
     def find_best_coach(self, train: Train, seat_count: int) -> CoachId | None:
-        for coach in train.coaches():
-            if train.occupancy_for_coach_after_booking(coach, seat_count) <= 0.7:
-                return coach
-        return None
+        return find_best_coach(train, seat_count)
+
+
+class AsyncTicketOffice:
+    """
+    Same as TicketOffice, but does not block while waiting for
+    the train data and booking reference services
+    """
+
+    def __init__(
+        self,
+        *,
+        client: AsyncClient,
+        prefetch_booking_reference: bool = False,
+        max_attempts: int = 3,
+        retry_delay: float = 0.01,
+    ) -> None:
+        self.client = client
+        self.prefetch_booking_reference = prefetch_booking_reference
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.spare_booking_references = SpareBookingReferences()
+
+    async def reserve(self, train_id: TrainId, seat_count: int) -> Reservation:
+        attempt = 1
+        while True:
+            try:
+                return await self._reserve_once(train_id, seat_count)
+            except ReservationConflict:
+                if attempt >= self.max_attempts:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self.retry_delay))
+            attempt += 1
+
+    async def _reserve_once(self, train_id: TrainId, seat_count: int) -> Reservation:
+        if self.prefetch_booking_reference:
+            return await self._reserve_with_prefetch(train_id, seat_count)
+
+        train = await self.client.get_train(train_id)
+
+        seat_ids = choose_seats(train, seat_count)
+
+        booking_reference = await self._get_booking_reference()
+
+        return await self._make_reservation(train, seat_ids, booking_reference)
+
+    async def _reserve_with_prefetch(
+        self, train_id: TrainId, seat_count: int
+    ) -> Reservation:
+        train_result, reference_result = await asyncio.gather(
+            self.client.get_train(train_id),
+            self._get_booking_reference(),
+            return_exceptions=True,
+        )
+        if isinstance(reference_result, BaseException):
+            raise reference_result
+        booking_reference = reference_result
+        if isinstance(train_result, BaseException):
+            self.spare_booking_references.put(booking_reference)
+            raise train_result
+        train = train_result
+
+        try:
+            seat_ids = choose_seats(train, seat_count)
+        except BaseException:
+            self.spare_booking_references.put(booking_reference)
+            raise
+
+        return await self._make_reservation(train, seat_ids, booking_reference)
+
+    async def _get_booking_reference(self) -> BookingReference:
+        spare = self.spare_booking_references.take()
+        if spare:
+            return spare
+        return await self.client.get_booking_reference()
+
+    async def _make_reservation(
+        self,
+        train: Train,
+        seat_ids: list[SeatId],
+        booking_reference: BookingReference,
+    ) -> Reservation:
+        reservation = Reservation(
+            train=train.id,
+            seats=seat_ids,
+            booking_reference=booking_reference,
+            train_version=train.version,
+        )
+
+        try:
+            await self.client.make_reservation(reservation)
+        except ReservationConflict:
+            self.spare_booking_references.put(booking_reference)
+            raise
+
+        return reservation
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    """
+    Exponential backoff with "full jitter": wait between 0 and
+    base * 2^attempt, so that conflicting ticket offices do not all retry
+    at the same time
+    """
+    return random.uniform(0, base * 2**attempt)
+
+
+def choose_seats(train: Occupancy, seat_count: int) -> list[SeatId]:
+    coach = find_best_coach(train, seat_count)
+    if not coach or train.occupancy_after_booking(seat_count) >= 0.7:
+        raise NotEnoughFreeSeats()
+
+    to_reserve = train.first_free_seats(coach, seat_count)
+    return [s.id for s in to_reserve]
+
+
+def find_best_coach(train: Occupancy, seat_count: int) -> CoachId | None:
+    for coach in train.coaches():
+        if train.occupancy_for_coach_after_booking(coach, seat_count) <= 0.7:
+            return coach
+    return None
 
 
 class NotEnoughFreeSeats(Exception):
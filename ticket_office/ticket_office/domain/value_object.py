@@ -1,7 +1,7 @@
 from functools import total_ordering
-from typing import Any, Generic, TypeVar
+from typing import Any, ClassVar, Generic, TypeVar
 
-from typing_extensions import Protocol
+from typing_extensions import Protocol, Self
 
 # Note the following two classes are mostly here to please mypy
 #
@@ -39,10 +39,28 @@ class ValueObject(Generic[T]):
         self.validate(value)
         self._value = value
 
+    @classmethod
+    def trusted(cls, value: T) -> Self:
+        """
+        Build a value object without calling validate().
+
+        Only use this for values that have already been checked, for
+        instance when decoding data coming from a trusted service
+        """
+        res = super().__new__(cls)
+        res._value = value
+        return res
+
     def validate(self, value: T) -> None:
         pass
 
+    @property
+    def value(self) -> T:
+        return self._value
+
     def __eq__(self, o: Any) -> bool:
+        if self is o:
+            return True
         if not isinstance(o, self.__class__):
             return False
         return self._value == o._value
@@ -59,3 +77,51 @@ class ValueObject(Generic[T]):
 
     def __hash__(self) -> int:
         return hash(self._value)
+
+
+class InternedValueObject(ValueObject[T]):
+    """
+    A value object with exactly one instance per distinct value, so that
+    validate() runs once per value and equality is (almost always) an
+    identity check.
+
+    Instances are never freed, so only use this for value objects that
+    can only take a small number of values.
+    """
+
+    _instances: ClassVar[dict[Any, Any]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._instances = {}
+
+    def __new__(cls, value: T) -> Self:
+        res = cls._instances.get(value)
+        if res is None:
+            res = super().__new__(cls)
+            res.validate(value)
+            res._value = value
+            # Note: setdefault() so that two threads interning the same
+            # value end up with the same instance
+            res = cls._instances.setdefault(value, res)
+        return res  # type: ignore[no-any-return]
+
+    def __init__(self, value: T) -> None:
+        # Everything is done in __new__
+        pass
+
+    @classmethod
+    def trusted(cls, value: T) -> Self:
+        # Note: values are validated anyway, otherwise an invalid instance
+        # would end up in cls._instances and be returned by the constructor.
+        # This only costs one validate() per distinct value
+        return cls(value)
+
+    # There is only one instance per value, so identity is enough, and
+    # it keeps dict lookups out of Python code
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Go through __new__ so that copies and unpickled values are interned too
+        return (self.__class__, (self._value,))
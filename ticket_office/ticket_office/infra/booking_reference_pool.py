@@ -0,0 +1,85 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from ticket_office.domain.reservation import BookingReference
+
+# A block of booking references, and how long they can be used, in seconds
+Lease = tuple[list[BookingReference], float]
+
+
+class BookingReferencePool:
+    """
+    Booking references leased in blocks, see `lease` - usually from the
+    booking_reference service.
+
+    A new block is leased in the background as soon as `low_water`
+    references or fewer are left, so take() only has to wait when the
+    pool is empty. References whose lease expired are never returned.
+
+    Thread safe
+    """
+
+    def __init__(
+        self,
+        lease: Callable[[], Lease],
+        *,
+        low_water: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.lease = lease
+        self.low_water = low_water
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (reference, expiration time), in the order they were leased
+        self._references: collections.deque[tuple[BookingReference, float]] = (
+            collections.deque()
+        )
+        self._refill: Future[None] | None = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="booking_references"
+        )
+
+    def take(self) -> BookingReference:
+        while True:
+            with self._lock:
+                self._drop_expired()
+                refill = None
+                if len(self._references) <= self.low_water:
+                    refill = self._start_refill()
+                if self._references:
+                    reference, _ = self._references.popleft()
+                    return reference
+            # Note: raises if the lease failed
+            assert refill
+            refill.result()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._drop_expired()
+            return len(self._references)
+
+    def _drop_expired(self) -> None:
+        now = self.clock()
+        while self._references and self._references[0][1] <= now:
+            self._references.popleft()
+
+    def _start_refill(self) -> "Future[None]":
+        # Note: called with self._lock held
+        if self._refill is None:
+            self._refill = self._executor.submit(self._do_refill)
+        return self._refill
+
+    def _do_refill(self) -> None:
+        try:
+            # Note: the lease starts before the response is received
+            leased_at = self.clock()
+            references, lease_seconds = self.lease()
+            with self._lock:
+                expires_at = leased_at + lease_seconds
+                self._references.extend((r, expires_at) for r in references)
+        finally:
+            with self._lock:
+                self._refill = None
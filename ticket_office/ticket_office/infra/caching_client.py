@@ -0,0 +1,128 @@
+import threading
+import time
+from typing import Callable
+
+from ticket_office.domain.client import Client
+from ticket_office.domain.reservation import (
+    AlreadyBooked,
+    BookingReference,
+    Reservation,
+    SeatNotFound,
+    Train,
+    TrainId,
+)
+from ticket_office.infra.ttl_cache import TtlCache
+
+
+class CachingClient(Client):
+    """
+    Wraps an other client and keeps the trains it returns for `ttl` seconds,
+    for at most `max_trains` trains.
+
+    When a cached train expires, it is revalidated with
+    Client.refresh_train() instead of being downloaded again.
+
+    Successful reservations are applied to the cached train, failed ones
+    evict it, so that the next get_train() sees fresh data.
+
+    Each caller gets its own copy of the cached train, see Train.copy()
+
+    Functions in `self.new_train_listeners` are called with the id of each
+    train that gets into the cache - see TrainWatcher
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        *,
+        max_trains: int = 128,
+        ttl: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.client = client
+        # Protects the cached trains against being copied while they
+        # are being booked
+        self._lock = threading.Lock()
+        self._trains: TtlCache[TrainId, Train] = TtlCache(
+            max_size=max_trains, ttl=ttl, clock=clock
+        )
+        self.new_train_listeners: list[Callable[[TrainId], None]] = []
+
+    def get_train(self, train_id: TrainId) -> Train:
+        train = self._trains.get(train_id)
+        if train:
+            return self._copy(train)
+
+        stale = self._trains.get_stale(train_id)
+        if stale:
+            # Note: reservations update the cached train under the lock,
+            # so the client gets its own copy
+            train = self.client.refresh_train(self._copy(stale))
+        else:
+            train = self.client.get_train(train_id)
+        self._trains.put(train_id, train)
+        for listener in self.new_train_listeners:
+            listener(train_id)
+        return self._copy(train)
+
+    def _copy(self, train: Train) -> Train:
+        with self._lock:
+            return train.copy()
+
+    def cached_train(self, train_id: TrainId) -> Train | None:
+        """
+        Return a copy of the cached train, even if it expired, without
+        fetching it
+        """
+        train = self._trains.get_stale(train_id)
+        if not train:
+            return None
+        return self._copy(train)
+
+    def update(self, train: Train) -> bool:
+        """
+        Replace the cached train with a more recent one, and reset its
+        expiration delay.
+
+        Return False if the train is no longer in the cache
+        """
+        with self._lock:
+            current = self._trains.get_stale(train.id)
+            if not current:
+                return False
+            if (
+                current.version is not None
+                and train.version is not None
+                and train.version < current.version
+            ):
+                # The cached train was updated in the meantime
+                return True
+            self._trains.put(train.id, train)
+            return True
+
+    def invalidate(self, train_id: TrainId) -> None:
+        self._trains.pop(train_id)
+
+    def get_booking_reference(self) -> BookingReference:
+        return self.client.get_booking_reference()
+
+    def get_booking_references(self, count: int) -> list[BookingReference]:
+        return self.client.get_booking_references(count)
+
+    def make_reservation(self, reservation: Reservation) -> None:
+        train_id = reservation.train
+        try:
+            self.client.make_reservation(reservation)
+        except Exception:
+            self.invalidate(train_id)
+            raise
+
+        train = self._trains.get_stale(train_id)
+        if not train:
+            return
+        try:
+            with self._lock:
+                train.record_reservation(reservation)
+        except (AlreadyBooked, SeatNotFound):
+            # The cached train disagrees with train_data
+            self.invalidate(train_id)
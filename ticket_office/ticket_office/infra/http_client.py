@@ -1,76 +1,310 @@
 import json
+import re
 from typing import Any
 
 import httpx
 
-from ticket_office.domain.client import Client
+from ticket_office.domain.client import AsyncClient, Client, ReservationConflict
+from ticket_office.domain.compact_train import CompactTrain
+from ticket_office.domain.occupancy import CoachOccupancy, OccupancySummary
 from ticket_office.domain.reservation import (
     BookingReference,
     CoachId,
     Reservation,
     Seat,
+    SeatId,
+    SeatNotFound,
     SeatNumber,
     Train,
     TrainId,
 )
+from ticket_office.infra.booking_reference_pool import BookingReferencePool, Lease
+from ticket_office.infra.wire_format import CONTENT_TYPE, decode_train
+
+TRAIN_DATA_URL = "http://localhost:8081"
+BOOKING_REFERENCE_URL = "http://localhost:8082"
+
+
+# Ask train_data for the compact encoding of trains, see wire_format.py
+COMPACT_HEADERS = {"Accept": f"{CONTENT_TYPE}, application/json"}
 
 
 class HttpClient(Client):
-    def __init__(self) -> None:
-        self._client = httpx.Client()
+    """
+    Unless `compact` is False, trains are fetched with the compact binary
+    encoding instead of json
+
+    When `booking_reference_block_size` is set, booking references are
+    leased in blocks of that size and kept in a BookingReferencePool
+
+    Long polling requests (see wait_for_changes()) have their own connection
+    pool, so that they never hold the connections needed by reservations
+    """
+
+    def __init__(
+        self, *, compact: bool = True, booking_reference_block_size: int = 0
+    ) -> None:
+        headers = COMPACT_HEADERS if compact else None
+        self._client = httpx.Client(headers=headers)
+        self._long_poll_client = httpx.Client(headers=headers)
+        self.booking_reference_block_size = booking_reference_block_size
+        self._booking_references: BookingReferencePool | None = None
+        if booking_reference_block_size:
+            self._booking_references = BookingReferencePool(
+                self._lease_booking_references,
+                low_water=booking_reference_block_size // 4,
+            )
 
     def reset(self, train_id: TrainId) -> None:
         # Note: only for tests!
-        response = self._client.post("http://localhost:8081/reset/" + str(train_id))
+        response = self._client.post(f"{TRAIN_DATA_URL}/reset/{train_id}")
         response.raise_for_status()
 
     def get_train(self, train_id: TrainId) -> Train:
+        response = self._client.get(f"{TRAIN_DATA_URL}/data_for_train/{train_id}")
+        response.raise_for_status()
+
+        return parse_train_response(train_id, response)
+
+    def refresh_train(self, train: Train) -> Train:
+        # Note: train_data always sends versions
+        if train.version is None:
+            return self.get_train(train.id)
+        return self._apply_changes(train, train.version)
+
+    def wait_for_changes(self, train: Train, timeout: float) -> Train:
+        if train.version is None:
+            return super().wait_for_changes(train, timeout)
+        return self._apply_changes(train, train.version, wait=timeout)
+
+    def _apply_changes(
+        self, train: Train, version: int, *, wait: float | None = None
+    ) -> Train:
+        params = {"version": str(version)}
+        http_timeout = httpx.Timeout(5.0)
+        client = self._client
+        if wait:
+            # Long polling: train_data only responds once the train changed,
+            # or after `wait` seconds
+            params["wait"] = str(wait)
+            http_timeout = httpx.Timeout(5.0, read=wait + 5.0)
+            client = self._long_poll_client
+        response = client.get(
+            f"{TRAIN_DATA_URL}/changes_since/{train.id}",
+            params=params,
+            timeout=http_timeout,
+        )
+        response.raise_for_status()
+        changes = response.json()
+        if changes["complete"]:
+            # Same layout as data_for_train, with the version first
+            return parse_train_bytes(train.id, response.content)
+        if not changes["seats"]:
+            return train
+
+        seats = [parse_seat(s) for s in changes["seats"].values()]
+        res = train.copy()
+        try:
+            res.update_seats(seats, version=changes["version"])
+        except SeatNotFound:
+            # The train no longer matches what the server has
+            return self.get_train(train.id)
+        return res
+
+    def get_occupancy_summary(
+        self, train_id: TrainId, free_seat_count: int
+    ) -> OccupancySummary:
         response = self._client.get(
-            "http://localhost:8081/data_for_train/" + str(train_id)
+            f"{TRAIN_DATA_URL}/occupancy/{train_id}",
+            params={"free_seats": str(free_seat_count)},
         )
         response.raise_for_status()
 
-        return parse_train_data(train_id, response.json())
+        return parse_occupancy_summary(train_id, response.json())
 
     def make_reservation(self, reservation: Reservation) -> None:
-        train_id = reservation.train
-        seat_ids = reservation.seats
-        booking_reference = reservation.booking_reference
-
-        # Note: this is *not* reservation.as_dict(), in particular,
-        # payload["seats"] is a *string*
-        payload: dict[str, str] = {
-            "train_id": str(train_id),
-            "seats": json.dumps([str(i) for i in seat_ids]),
-            "booking_reference": str(booking_reference),
-        }
-
-        response = self._client.post("http://localhost:8081/reserve", data=payload)
-        # Note: sadly, the train_data responds with 200 OK and with invalid json
-        # in case of error
-        if "already booked" in response.text:
-            raise Exception("Already booked")
+        payload = reservation_payload(reservation)
+        response = self._client.post(f"{TRAIN_DATA_URL}/reserve", data=payload)
+        check_reservation_response(response)
 
     def get_booking_reference(self) -> BookingReference:
-        response = self._client.get("http://localhost:8082/booking_reference")
+        # Note: an empty pool is falsy
+        if self._booking_references is not None:
+            return self._booking_references.take()
+        response = self._client.get(f"{BOOKING_REFERENCE_URL}/booking_reference")
+        response.raise_for_status()
+        return BookingReference(response.text)
+
+    def get_booking_references(self, count: int) -> list[BookingReference]:
+        if self._booking_references is not None:
+            return [self._booking_references.take() for _ in range(count)]
+        # Note: the references are used right away, so the lease does not matter
+        references, _ = self._get_booking_references(count)
+        return references
+
+    def _lease_booking_references(self) -> Lease:
+        return self._get_booking_references(self.booking_reference_block_size)
+
+    def _get_booking_references(self, count: int) -> Lease:
+        # Note: the booking_reference service may return fewer references
+        # than asked for
+        response = self._client.get(
+            f"{BOOKING_REFERENCE_URL}/booking_references",
+            params={"count": str(count)},
+        )
+        response.raise_for_status()
+        lease = response.json()
+        references = [BookingReference(r) for r in lease["references"]]
+        return references, lease["lease_seconds"]
+
+
+class AsyncHttpClient(AsyncClient):
+    def __init__(self, *, compact: bool = True) -> None:
+        self._client = httpx.AsyncClient(headers=COMPACT_HEADERS if compact else None)
+
+    async def reset(self, train_id: TrainId) -> None:
+        # Note: only for tests!
+        response = await self._client.post(f"{TRAIN_DATA_URL}/reset/{train_id}")
+        response.raise_for_status()
+
+    async def get_train(self, train_id: TrainId) -> Train:
+        response = await self._client.get(f"{TRAIN_DATA_URL}/data_for_train/{train_id}")
+        response.raise_for_status()
+
+        return parse_train_response(train_id, response)
+
+    async def make_reservation(self, reservation: Reservation) -> None:
+        payload = reservation_payload(reservation)
+        response = await self._client.post(f"{TRAIN_DATA_URL}/reserve", data=payload)
+        check_reservation_response(response)
+
+    async def get_booking_reference(self) -> BookingReference:
+        response = await self._client.get(f"{BOOKING_REFERENCE_URL}/booking_reference")
         response.raise_for_status()
         return BookingReference(response.text)
 
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def reservation_payload(reservation: Reservation) -> dict[str, str]:
+    train_id = reservation.train
+    seat_ids = reservation.seats
+    booking_reference = reservation.booking_reference
+
+    # Note: this is *not* reservation.as_dict(), in particular,
+    # payload["seats"] is a *string*
+    payload = {
+        "train_id": str(train_id),
+        "seats": json.dumps([str(i) for i in seat_ids]),
+        "booking_reference": str(booking_reference),
+    }
+    if reservation.train_version is not None:
+        payload["version"] = str(reservation.train_version)
+    return payload
+
+
+def check_reservation_response(response: httpx.Response) -> None:
+    if response.status_code == 409:
+        raise ReservationConflict(response.json()["error"])
+    # Note: sadly, the train_data responds with 200 OK and with invalid json
+    # when a seat is already booked
+    if not is_compact(response) and "already booked" in response.text:
+        raise ReservationConflict(response.text)
+    response.raise_for_status()
+
+
+def is_compact(response: httpx.Response) -> bool:
+    content_type: str = response.headers.get("Content-Type", "")
+    return content_type.startswith(CONTENT_TYPE)
+
+
+def parse_train_response(train_id: TrainId, response: httpx.Response) -> Train:
+    if is_compact(response):
+        return decode_train(train_id, response.content)
+    return parse_train_bytes(train_id, response.content)
+
 
 def parse_train_data(train_id: TrainId, train_data: Any) -> Train:
     seat_dicts = train_data["seats"].values()
-    seats: list[Seat] = []
-    for seat_dict in seat_dicts:
-        coach_id = CoachId(seat_dict["coach"])
-        number = SeatNumber(int(seat_dict["seat_number"]))
-        booking_str = seat_dict["booking_reference"]
-        if booking_str:
-            booking_reference = BookingReference(booking_str)
-        else:
-            booking_reference = None
-        seat = Seat(
-            number=number, coach_id=coach_id, booking_reference=booking_reference
+    seats = [parse_seat(seat_dict) for seat_dict in seat_dicts]
+    return Train(id=train_id, seats=seats, version=train_data.get("version"))
+
+
+def parse_occupancy_summary(train_id: TrainId, occupancy: Any) -> OccupancySummary:
+    coaches_by_id = {}
+    for coach, coach_dict in occupancy["coaches"].items():
+        coach_id = CoachId(coach)
+        free_seats = [
+            SeatId(SeatNumber(n), coach_id) for n in coach_dict["free_seat_numbers"]
+        ]
+        coaches_by_id[coach_id] = CoachOccupancy(
+            seat_count=coach_dict["seat_count"],
+            booked_count=coach_dict["booked_count"],
+            free_seats=free_seats,
         )
-        seats.append(seat)
+    return OccupancySummary(
+        id=train_id, coaches_by_id=coaches_by_id, version=occupancy["version"]
+    )
+
+
+def parse_seat(seat_dict: Any) -> Seat:
+    coach_id = CoachId(seat_dict["coach"])
+    number = SeatNumber(int(seat_dict["seat_number"]))
+    booking_str = seat_dict["booking_reference"]
+    if booking_str:
+        # Note: validation is the same as the check above
+        booking_reference = BookingReference.trusted(booking_str)
+    else:
+        booking_reference = None
+    return Seat(number=number, coach_id=coach_id, booking_reference=booking_reference)
+
+
+# Matches one seat, as sent by train_data. Values never contain quotes or
+# backslashes, unless train_data starts sending something unexpected
+SEAT_RE = re.compile(
+    rb'"coach"\s*:\s*"([^"\\]*)"\s*,\s*'
+    rb'"seat_number"\s*:\s*"([^"\\]*)"\s*,\s*'
+    rb'"booking_reference"\s*:\s*"([^"\\]*)"'
+)
+VERSION_RE = re.compile(rb'"version"\s*:\s*(\d+)')
+SEATS_RE = re.compile(rb'"seats"\s*:\s*\{')
+
+
+def parse_train_bytes(train_id: TrainId, content: bytes) -> Train:
+    """
+    Same as parse_train_data(), but decodes the raw body of the
+    data_for_train response directly into a CompactTrain, without building
+    any intermediate dict or Seat object.
+
+    Falls back to parse_train_data() if the body does not look like what
+    train_data usually sends
+    """
+    matches = SEAT_RE.findall(content)
+    # Note: bodies without seats, like the "null" returned for unknown
+    # trains, go through parse_train_data() too, so that they fail
+    if not SEATS_RE.search(content) or len(matches) != content.count(b'"seat_number"'):
+        return parse_train_data(train_id, json.loads(content))
+
+    # Most values are repeated a lot, so only build each value object once
+    coach_ids: dict[bytes, CoachId] = {}
+    numbers: dict[bytes, SeatNumber] = {}
+    booking_references: dict[bytes, BookingReference | None] = {b"": None}
+    rows = []
+    for coach, number, reference in matches:
+        coach_id = coach_ids.get(coach)
+        if coach_id is None:
+            coach_id = coach_ids[coach] = CoachId(coach.decode())
+        seat_number = numbers.get(number)
+        if seat_number is None:
+            seat_number = numbers[number] = SeatNumber(int(number))
+        if reference in booking_references:
+            booking_reference = booking_references[reference]
+        else:
+            booking_reference = BookingReference.trusted(reference.decode())
+            booking_references[reference] = booking_reference
+        rows.append((coach_id, seat_number, booking_reference))
 
-    return Train(id=train_id, seats=seats)
+    version_match = VERSION_RE.search(content)
+    version = int(version_match.group(1)) if version_match else None
+    return CompactTrain.from_rows(id=train_id, rows=rows, version=version)
@@ -0,0 +1,98 @@
+import concurrent.futures
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+from ticket_office.infra.ttl_cache import TtlCache
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    Raised when an idempotency key is sent again with a different request
+    """
+
+
+class RequestInProgress(Exception):
+    """
+    Raised when a request with the same idempotency key is still running
+    after waiting for it
+    """
+
+
+class IdempotencyStore:
+    """
+    Remembers the responses to requests made with an idempotency key, for
+    `ttl` seconds and for at most `max_size` keys.
+
+    A request made again with the same key gets the same response, without
+    running it again. If the first request is still running, the new one
+    waits for its response, for at most `wait_timeout` seconds. Requests
+    that are running are never evicted.
+
+    Failed requests are not remembered, so that they can be retried.
+
+    Note: responses are only kept in this process, so requests with the
+    same key must be handled by the same process
+
+    Thread safe
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 10_000,
+        ttl: float = 3600,
+        wait_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._responses: TtlCache[str, tuple[Hashable, str]] = TtlCache(
+            max_size=max_size, ttl=ttl, clock=clock
+        )
+        # Requests that are still running - protected by self._lock
+        self._in_flight: dict[str, tuple[Hashable, Future[str]]] = {}
+
+    def run(self, key: str, request: Hashable, respond: Callable[[], str]) -> str:
+        """
+        Return the response to `request`, calling `respond` only if
+        there is no response for `key` yet.
+
+        Raise IdempotencyKeyReused if `key` was used for another request,
+        and RequestInProgress if the request made with `key` is still running
+        after `wait_timeout` seconds
+        """
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            done = None if in_flight else self._responses.get(key)
+            if in_flight is None and done is None:
+                future: Future[str] = Future()
+                self._in_flight[key] = (request, future)
+
+        if done is not None:
+            known_request, response = done
+            if known_request != request:
+                raise IdempotencyKeyReused(key)
+            return response
+        if in_flight is not None:
+            known_request, known_future = in_flight
+            if known_request != request:
+                raise IdempotencyKeyReused(key)
+            try:
+                return known_future.result(timeout=self.wait_timeout)
+            except concurrent.futures.TimeoutError:
+                raise RequestInProgress(key)
+
+        try:
+            response = respond()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._responses.put(key, (request, response))
+        future.set_result(response)
+        return response
@@ -0,0 +1,104 @@
+import itertools
+import json
+import threading
+from pathlib import Path
+
+from ticket_office.domain.client import Client, ReservationConflict
+from ticket_office.domain.reservation import (
+    BookingReference,
+    Reservation,
+    Seat,
+    Train,
+    TrainId,
+)
+from ticket_office.infra.http_client import parse_train_data
+
+# Same as in booking_reference/server.py
+STARTING_POINT = 123456789
+
+
+class InProcessClient(Client):
+    """
+    Keeps the trains and generates booking references in the same process
+    as the ticket office, with the same behavior as the train_data and
+    booking_reference services, minus the HTTP round trips.
+
+    Warning: unlike those services, nothing is saved to disk. When the
+    process restarts, all reservations are forgotten and booking references
+    start again from `starting_point`, so they are handed out twice. Only
+    use it for tests and benchmarks
+
+    Thread safe: each train has its own lock, and reservations are checked
+    and applied while holding it
+    """
+
+    def __init__(
+        self, trains: list[Train], *, starting_point: int = STARTING_POINT
+    ) -> None:
+        self._trains = {t.id: t for t in trains}
+        for train in trains:
+            if train.version is None:
+                train.version = 0
+        self._locks = {t.id: threading.Lock() for t in trains}
+        self._counter = itertools.count(starting_point + 1)
+        self._counter_lock = threading.Lock()
+
+    @classmethod
+    def from_json_file(
+        cls, path: Path, *, starting_point: int = STARTING_POINT
+    ) -> "InProcessClient":
+        """
+        Load the trains from a file in the same format as
+        train_data/trains.json
+        """
+        trains_data = json.loads(path.read_text())
+        trains = [
+            parse_train_data(TrainId(train_id), train_data)
+            for train_id, train_data in trains_data.items()
+        ]
+        return cls(trains, starting_point=starting_point)
+
+    def _lock_for(self, train_id: TrainId) -> threading.Lock:
+        lock = self._locks.get(train_id)
+        if lock is None:
+            raise KeyError(f"No such train: {train_id}")
+        return lock
+
+    def get_train(self, train_id: TrainId) -> Train:
+        with self._lock_for(train_id):
+            return self._trains[train_id].copy()
+
+    def make_reservation(self, reservation: Reservation) -> None:
+        train_id = reservation.train
+        with self._lock_for(train_id):
+            train = self._trains[train_id]
+            train_version = reservation.train_version
+            if train_version is not None and train_version != train.version:
+                raise ReservationConflict("version conflict")
+            for seat_id in reservation.seats:
+                # Note: raises SeatNotFound for unknown seats
+                if train.is_free(seat_id):
+                    continue
+                existing_reference = train.booking_reference(seat_id)
+                if existing_reference != reservation.booking_reference:
+                    raise ReservationConflict(
+                        f"already booked with reference: {existing_reference}"
+                    )
+            train.book(reservation.seats, reservation.booking_reference)
+            assert train.version is not None
+            train.version += 1
+
+    def get_booking_reference(self) -> BookingReference:
+        with self._counter_lock:
+            number = next(self._counter)
+        return BookingReference(f"{number:x}")
+
+    def reset(self, train_id: TrainId) -> None:
+        # Note: only for tests!
+        with self._lock_for(train_id):
+            train = self._trains[train_id]
+            free_seats = [
+                Seat(number=s.number, coach_id=s.coach_id) for s in train.seats()
+            ]
+            assert train.version is not None
+            train.update_seats(free_seats, version=train.version + 1)
@@ -1,42 +1,283 @@
 import json
+import os
+import signal
+import sys
+import traceback
+from typing import Any, Callable, Iterable, Iterator
 
 import cherrypy
+from cheroot import wsgi
 
 from ticket_office.domain.client import Reservation, TrainId
-from ticket_office.domain.ticket_office import TicketOffice
+from ticket_office.domain.ticket_office import Reserver, TicketOffice
 from ticket_office.infra.http_client import HttpClient
+from ticket_office.infra.idempotency import (
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    RequestInProgress,
+)
+
+# Maximum number of reservations in a single call to reserve_many, and
+# maximum size of its body, in bytes
+MAX_BULK_SIZE = 10_000
+MAX_BULK_BYTES = 1024 * 1024
 
 
 class Server:
+    """
+    When `idempotency_store` is set, requests to reserve() can have an
+    Idempotency-Key header: the same request sent again with the same key
+    gets the same response, and does not make a new reservation - see
+    IdempotencyStore.
+
+    Otherwise, requests with an Idempotency-Key header are rejected, rather
+    than risking booking seats twice. This is the case with several workers
+    (see serve()): the store is not shared between processes, and retries
+    usually end up in another process
+    """
+
     def __init__(
         self,
         *,
-        ticket_office: TicketOffice,
+        ticket_office: Reserver,
+        idempotency_store: IdempotencyStore | None = None,
     ) -> None:
         self.ticket_office = ticket_office
+        self.idempotency_store = idempotency_store
 
     def reserve(self, train_id: str, seat_count: str) -> str:
+        key = cherrypy.request.headers.get("Idempotency-Key")
+        if not key:
+            return self._reserve(train_id, seat_count)
+        if self.idempotency_store is None:
+            raise cherrypy.HTTPError(
+                501, "Idempotency-Key is not supported by this server"
+            )
+        try:
+            return self.idempotency_store.run(
+                key,
+                (train_id, seat_count),
+                lambda: self._reserve(train_id, seat_count),
+            )
+        except IdempotencyKeyReused:
+            raise cherrypy.HTTPError(
+                422, "Idempotency-Key already used for another request"
+            )
+        except RequestInProgress:
+            raise cherrypy.HTTPError(
+                409, "A request with this Idempotency-Key is still in progress"
+            )
+
+    def _reserve(self, train_id: str, seat_count: str) -> str:
         # TODO: 400 error if train_id is not valid, or seat_count is not an int
         reservation = self.ticket_office.reserve(TrainId(train_id), int(seat_count))
         return serialize_reservation(reservation)
 
+    def reserve_many(self) -> Iterator[bytes]:
+        """
+        Make many reservations at once.
 
-def serialize_reservation(reservation: Reservation) -> str:
+        The body is in NDJSON: one json document per line, with a "train_id"
+        and a "seat_count". The response is also in NDJSON, with one line
+        per reservation, sent as soon as the reservation is done - possibly
+        in a different order. Each line contains the "index" of the
+        matching request line, and either a "reservation" or an "error".
+
+        Reservations that conflict with other ones are retried, see
+        TicketOffice.reserve_many()
+        """
+        content_length = cherrypy.request.headers.get("Content-Length")
+        if content_length and int(content_length) > MAX_BULK_BYTES:
+            raise cherrypy.HTTPError(413, f"At most {MAX_BULK_BYTES} bytes")
+        # Note: also checked after reading, as there is no Content-Length
+        # with chunked requests
+        body = cherrypy.request.body.read(MAX_BULK_BYTES + 1)
+        if len(body) > MAX_BULK_BYTES:
+            raise cherrypy.HTTPError(413, f"At most {MAX_BULK_BYTES} bytes")
+        lines = body.splitlines()
+        if len(lines) > MAX_BULK_SIZE:
+            raise cherrypy.HTTPError(413, f"At most {MAX_BULK_SIZE} reservations")
+        cherrypy.response.headers["Content-Type"] = "application/x-ndjson"
+        return (line.encode() + b"\n" for line in self.reserve_lines(lines))
+
+    reserve_many._cp_config = {"response.stream": True}  # type: ignore[attr-defined]
+
+    def reserve_lines(self, lines: Iterable[bytes]) -> Iterator[str]:
+        # Reservations are grouped by train, so that each train is only
+        # fetched once, see TicketOffice.reserve_many()
+        by_train: dict[TrainId, list[tuple[int, int]]] = {}
+        for index, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                train_id = TrainId(request["train_id"])
+                seat_count = int(request["seat_count"])
+                if seat_count <= 0:
+                    raise ValueError("seat_count should be positive")
+            except (ValueError, KeyError, TypeError) as e:
+                yield serialize_error(index, e)
+                continue
+            by_train.setdefault(train_id, []).append((index, seat_count))
+
+        for train_id, requests in by_train.items():
+            seat_counts = [seat_count for _, seat_count in requests]
+            results = self.ticket_office.reserve_many(train_id, seat_counts)
+            done = 0
+            try:
+                for (index, _), result in zip(requests, results):
+                    done += 1
+                    if isinstance(result, Exception):
+                        yield serialize_error(index, result)
+                    else:
+                        yield json.dumps(
+                            {"index": index, "reservation": reservation_as_dict(result)}
+                        )
+            except Exception as e:
+                # Most likely, the train could not be fetched
+                for index, _ in requests[done:]:
+                    yield serialize_error(index, e)
+
+
+def reservation_as_dict(reservation: Reservation) -> dict[str, Any]:
     seat_ids = [str(s) for s in reservation.seats]
-    as_dict = {
+    return {
         "train_id": str(reservation.train),
         "seats": seat_ids,
         "booking_reference": str(reservation.booking_reference),
     }
-    return json.dumps(as_dict)
 
 
-def main() -> None:
+def serialize_reservation(reservation: Reservation) -> str:
+    return json.dumps(reservation_as_dict(reservation))
+
+
+def serialize_error(index: int, error: Exception) -> str:
+    message = str(error) or type(error).__name__
+    return json.dumps({"index": index, "error": message})
+
+
+def expose_endpoints() -> None:
     Server.reserve.exposed = True  # type: ignore[attr-defined]
+    Server.reserve_many.exposed = True  # type: ignore[attr-defined]
+
+
+def serve(
+    make_server: Callable[[], Server],
+    *,
+    host: str = "0.0.0.0",
+    port: int = 8083,
+    workers: int = 1,
+    threads: int = 10,
+    backlog: int = 5,
+) -> None:
+    """
+    Serve the ticket office with `workers` processes of `threads` threads
+    each, accepting connections on `host` and `port`.
+
+    With more than one worker, the workers are forked and listen with
+    SO_REUSEPORT, so that the kernel spreads the connections between them.
+    Each worker calls `make_server` after being forked, so that no client or
+    thread is shared between processes. If a worker stops on its own (for
+    instance, because it could not listen on the port), the other ones are
+    stopped too, and the process exits with an error, so that whatever
+    supervises it can restart everything
+    """
+    if workers < 1:
+        raise ValueError("workers should be at least 1")
+    if workers == 1:
+        expose_endpoints()
+        cherrypy.config.update(
+            {
+                "server.socket_host": host,
+                "server.socket_port": port,
+                "server.thread_pool": threads,
+                "server.socket_queue_size": backlog,
+            }
+        )
+        cherrypy.quickstart(make_server())
+        return
+
+    children = set()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_worker(
+                    make_server,
+                    host=host,
+                    port=port,
+                    threads=threads,
+                    backlog=backlog,
+                )
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children.add(pid)
+
+    stopping = False
+
+    def stop_children(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for child in list(children):
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_children)
+    signal.signal(signal.SIGINT, stop_children)
+    exit_code = 0
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if os.waitstatus_to_exitcode(status) not in (0, -signal.SIGTERM):
+            exit_code = 1
+        if not stopping:
+            # The worker was not asked to stop
+            exit_code = 1
+            stop_children(signal.SIGTERM, None)
+    sys.exit(exit_code)
+
+
+def _run_worker(
+    make_server: Callable[[], Server],
+    *,
+    host: str,
+    port: int,
+    threads: int,
+    backlog: int,
+) -> None:
+    expose_endpoints()
+    # Note: cherrypy's own HTTP server does not support SO_REUSEPORT, so the
+    # application is served by cheroot directly
+    cherrypy.config.update({"engine.autoreload.on": False})
+    cherrypy.server.unsubscribe()
+    cherrypy.tree.mount(make_server(), "/")
+    cherrypy.engine.start()
+    server = wsgi.Server(
+        (host, port),
+        cherrypy.tree,
+        numthreads=threads,
+        request_queue_size=backlog,
+        reuse_port=True,
+    )
+    try:
+        server.safe_start()
+    finally:
+        cherrypy.engine.exit()
+
+
+def main() -> None:
+    expose_endpoints()
     cherrypy.config.update({"server.socket_port": 8083})
     client = HttpClient()
     ticket_office = TicketOffice(client=client)
-    server = Server(ticket_office=ticket_office)
+    server = Server(ticket_office=ticket_office, idempotency_store=IdempotencyStore())
     cherrypy.quickstart(server)
 
 
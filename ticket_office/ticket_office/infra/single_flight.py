@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from ticket_office.domain.client import Client
+from ticket_office.domain.reservation import (
+    BookingReference,
+    Reservation,
+    Train,
+    TrainId,
+)
+
+
+class SingleFlightClient(Client):
+    """
+    Wraps an other client so that concurrent calls to get_train() for the
+    same train share a single call to the wrapped client.
+
+    Every caller gets its own copy of the train (see Train.copy()), so
+    they can still book seats independently
+    """
+
+    def __init__(self, client: Client) -> None:
+        self.client = client
+        self._lock = threading.Lock()
+        self._in_flight: dict[TrainId, Future[Train]] = {}
+
+    def get_train(self, train_id: TrainId) -> Train:
+        return self._single_flight(train_id, lambda: self.client.get_train(train_id))
+
+    def refresh_train(self, train: Train) -> Train:
+        return self._single_flight(train.id, lambda: self.client.refresh_train(train))
+
+    def _single_flight(self, train_id: TrainId, fetch: Callable[[], Train]) -> Train:
+        with self._lock:
+            future = self._in_flight.get(train_id)
+            is_leader = future is None
+            if future is None:
+                future = self._in_flight[train_id] = Future()
+
+        if is_leader:
+            try:
+                future.set_result(fetch())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._in_flight[train_id]
+
+        return future.result().copy()
+
+    def get_booking_reference(self) -> BookingReference:
+        return self.client.get_booking_reference()
+
+    def get_booking_references(self, count: int) -> list[BookingReference]:
+        return self.client.get_booking_references(count)
+
+    def make_reservation(self, reservation: Reservation) -> None:
+        self.client.make_reservation(reservation)
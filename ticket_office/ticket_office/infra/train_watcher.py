@@ -0,0 +1,96 @@
+import threading
+
+from ticket_office.domain.reservation import TrainId
+from ticket_office.infra.caching_client import CachingClient
+
+
+class TrainWatcher:
+    """
+    Keeps the trains cached by a CachingClient up to date, so that
+    reservations do not have to fetch them again when they expire.
+
+    Each cached train is watched in its own background thread, which waits
+    for the train to change with Client.wait_for_changes() and puts the new
+    version in the cache. The thread stops when the train leaves the cache.
+
+    `timeout` should be less than the TTL of the cache, otherwise quiet
+    trains expire between two waits
+
+    Each wait keeps a connection and a train_data thread busy, so at most
+    `max_watched` trains are watched at the same time. The other cached
+    trains are revalidated by the cache as usual, and get watched when they
+    are put in the cache again once a thread is available.
+
+    train_data also limits the number of waiting clients across all ticket
+    offices, and rejects the others with a 503 - their threads try again
+    after `retry_delay` seconds
+    """
+
+    def __init__(
+        self,
+        caching_client: CachingClient,
+        *,
+        timeout: float = 25.0,
+        retry_delay: float = 1.0,
+        max_watched: int = 16,
+    ) -> None:
+        self.caching_client = caching_client
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_watched = max_watched
+        self._lock = threading.Lock()
+        self._threads: dict[TrainId, threading.Thread] = {}
+        self._stopped = threading.Event()
+        caching_client.new_train_listeners.append(self.watch)
+
+    def watch(self, train_id: TrainId) -> None:
+        with self._lock:
+            if train_id in self._threads or self._stopped.is_set():
+                return
+            if len(self._threads) >= self.max_watched:
+                return
+            thread = threading.Thread(
+                target=self._watch,
+                args=(train_id,),
+                name=f"watch-{train_id}",
+                daemon=True,
+            )
+            self._threads[train_id] = thread
+        thread.start()
+
+    def watched_trains(self) -> list[TrainId]:
+        with self._lock:
+            return list(self._threads)
+
+    def stop(self) -> None:
+        """
+        Stop watching all trains. Threads waiting for a change stop once
+        the wait is over
+        """
+        self._stopped.set()
+
+    def _watch(self, train_id: TrainId) -> None:
+        client = self.caching_client.client
+        while not self._stopped.is_set():
+            train = self.caching_client.cached_train(train_id)
+            if train:
+                try:
+                    train = client.wait_for_changes(train, self.timeout)
+                except Exception:
+                    # Most likely train_data is not reachable, try again
+                    # later - meanwhile, the cache revalidates the train
+                    # as usual
+                    self._stopped.wait(self.retry_delay)
+                    continue
+                if self.caching_client.update(train):
+                    continue
+
+            with self._lock:
+                # Note: checked again with the lock held, so that a train
+                # added to the cache right now is not left unwatched
+                if self.caching_client.cached_train(train_id) is None:
+                    del self._threads[train_id]
+                    return
+
+        with self._lock:
+            del self._threads[train_id]
@@ -0,0 +1,76 @@
+import collections
+import threading
+import time
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TtlCache(Generic[K, V]):
+    """
+    A thread-safe mapping with at most `max_size` entries, where each entry
+    is only fresh for `ttl` seconds after it was put.
+
+    Expired entries are kept until they are evicted (least recently used
+    first) so that callers can revalidate them instead of starting from
+    scratch - see get_stale()
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size should be strictly positive")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[K, tuple[float, V]] = (
+            collections.OrderedDict()
+        )
+
+    def get(self, key: K) -> V | None:
+        """
+        Return the value for `key`, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_stale(self, key: K) -> V | None:
+        """
+        Return the value for `key` even if it is expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,93 @@
+import struct
+import sys
+from array import array
+
+from ticket_office.domain.compact_train import NO_SEAT, CompactTrain
+from ticket_office.domain.reservation import BookingReference, CoachId, TrainId
+
+# Compact encoding of trains sent by train_data - see train_data/wire_format.py
+CONTENT_TYPE = "application/x-train-seats"
+MAGIC = b"TRS1"
+
+# Seat numbers go from 1 to 100
+MAX_SLOT_COUNT = 101
+
+
+def decode_train(train_id: TrainId, content: bytes) -> CompactTrain:
+    """
+    Decode a train sent with the compact encoding.
+
+    Raise ValueError if `content` is not a valid train
+    """
+    try:
+        return _decode_train(train_id, memoryview(content))
+    except struct.error as e:
+        raise ValueError(f"Truncated train data: {e}") from e
+
+
+def _decode_train(train_id: TrainId, content: memoryview) -> CompactTrain:
+    if content[:4] != MAGIC:
+        raise ValueError("Not a compact train")
+    version, reference_count = struct.unpack_from("<II", content, 4)
+    offset = 12
+
+    references = []
+    for _ in range(reference_count):
+        (length,) = struct.unpack_from("<H", content, offset)
+        offset += 2
+        end = offset + length
+        value = bytes(content[offset:end]).decode()
+        offset = end
+        references.append(BookingReference(value))
+
+    (coach_count,) = struct.unpack_from("<H", content, offset)
+    offset += 2
+    slots = {}
+    for _ in range(coach_count):
+        (length,) = struct.unpack_from("<H", content, offset)
+        offset += 2
+        end = offset + length
+        coach_id = CoachId(bytes(content[offset:end]).decode())
+        offset = end
+        (slot_count,) = struct.unpack_from("<H", content, offset)
+        offset += 2
+        if slot_count > MAX_SLOT_COUNT:
+            raise ValueError(f"Too many seats in coach {coach_id}")
+        end = offset + 2 * slot_count
+        if end > len(content):
+            raise ValueError("Truncated train data")
+        coach_slots = array("H")
+        coach_slots.frombytes(content[offset:end])
+        if sys.byteorder == "big":
+            coach_slots.byteswap()
+        if coach_slots and coach_slots[0] != NO_SEAT:
+            raise ValueError(f"Invalid seat number 0 in coach {coach_id}")
+        offset = end
+        slots[coach_id] = coach_slots
+
+    return CompactTrain.from_slots(
+        id=train_id, slots=slots, references=references, version=version
+    )
+
+
+def encode_train(train: CompactTrain) -> bytes:
+    """
+    Inverse of decode_train() - train_data has its own implementation,
+    this one is used for tests and benchmarks
+    """
+    slots, references = train.to_slots()
+    encoded_references = [r.value.encode() for r in references]
+    parts = [MAGIC, struct.pack("<II", train.version or 0, len(references))]
+    for reference in encoded_references:
+        parts.append(struct.pack("<H", len(reference)))
+        parts.append(reference)
+    parts.append(struct.pack("<H", len(slots)))
+    for coach_id, coach_slots in slots.items():
+        coach = coach_id.value.encode()
+        parts.append(struct.pack("<H", len(coach)))
+        parts.append(coach)
+        parts.append(struct.pack("<H", len(coach_slots)))
+        if sys.byteorder == "big":
+            coach_slots.byteswap()
+        parts.append(coach_slots.tobytes())
+    return b"".join(parts)
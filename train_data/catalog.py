@@ -0,0 +1,200 @@
+"""
+Compact, memory-mapped storage for large train catalogs.
+
+Convert trains.json to a catalog with:
+
+    python catalog.py trains.json trains.catalog
+
+then start the server with `--catalog trains.catalog`.
+
+A catalog file looks like this (all integers are little-endian):
+
+    header:  b"TRAINCAT", format version (u32), train count (u32), index offset (u64)
+    records: one per train, json-encoded as [version, [[seat id, coach, seat number, booking reference], ...]]
+    keys:    the train ids, utf-8 encoded
+    index:   one entry per train, sorted by train id:
+             key offset (u64), key length (u32), record offset (u64), record length (u32)
+
+Nothing is read when the catalog is opened: trains are looked up by binary
+search in the index, and decoded on first access.
+"""
+import collections
+import json
+import mmap
+import struct
+import sys
+import threading
+
+
+MAGIC = b"TRAINCAT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+INDEX_ENTRY = struct.Struct("<QIQI")
+
+
+class Catalog:
+    """
+    Read-only view of a catalog file, that behaves like the dict of trains
+    used by TrainDataService.
+
+    At most `max_cached` unmodified trains are kept in memory - the least
+    recently used ones are decoded again on next access. Trains stored with
+    `catalog[train_id] = train` are considered modified, and are kept in
+    memory for good.
+
+    Thread safe, but callers must not modify the same train concurrently
+    """
+
+    def __init__(self, path, max_cached=1024):
+        self.max_cached = max_cached
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, self._count, self._index_offset = HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("{0} is not a train catalog".format(path))
+        self._lock = threading.Lock()
+        self._cached = collections.OrderedDict()
+        self._modified = {}
+
+    def _entry(self, position):
+        offset = self._index_offset + position * INDEX_ENTRY.size
+        return INDEX_ENTRY.unpack_from(self._mmap, offset)
+
+    def _key(self, entry):
+        key_offset, key_length, _, _ = entry
+        return self._mmap[key_offset : key_offset + key_length]
+
+    def _find(self, train_id):
+        key = train_id.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            middle_key = self._key(entry)
+            if middle_key == key:
+                return entry
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _decode(self, entry):
+        _, _, record_offset, record_length = entry
+        record = self._mmap[record_offset : record_offset + record_length]
+        version, rows = json.loads(record)
+        seats = {}
+        for seat_id, coach, seat_number, booking_reference in rows:
+            seats[seat_id] = {
+                "coach": coach,
+                "seat_number": seat_number,
+                "booking_reference": booking_reference,
+            }
+        return {"seats": seats, "version": version}
+
+    def get(self, train_id, default=None):
+        with self._lock:
+            train = self._modified.get(train_id)
+            if train is None:
+                train = self._cached.get(train_id)
+                if train is not None:
+                    self._cached.move_to_end(train_id)
+            if train is not None:
+                return train
+
+        entry = self._find(train_id)
+        if entry is None:
+            return default
+        train = self._decode(entry)
+
+        with self._lock:
+            # Another thread may have decoded it in the meantime
+            existing = self._modified.get(train_id) or self._cached.get(train_id)
+            if existing is not None:
+                return existing
+            self._cached[train_id] = train
+            while len(self._cached) > self.max_cached:
+                self._cached.popitem(last=False)
+        return train
+
+    def __getitem__(self, train_id):
+        train = self.get(train_id)
+        if train is None:
+            raise KeyError(train_id)
+        return train
+
+    def __setitem__(self, train_id, train):
+        with self._lock:
+            self._cached.pop(train_id, None)
+            self._modified[train_id] = train
+
+    def __contains__(self, train_id):
+        with self._lock:
+            if train_id in self._modified:
+                return True
+        return self._find(train_id) is not None
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self._key(self._entry(position)).decode()
+        with self._lock:
+            added = [t for t in self._modified if self._find(t) is None]
+        yield from added
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def cached_count(self):
+        with self._lock:
+            return len(self._cached)
+
+
+def encode_train(train):
+    rows = [
+        [seat_id, seat["coach"], seat["seat_number"], seat["booking_reference"]]
+        for seat_id, seat in train["seats"].items()
+    ]
+    return json.dumps([train.get("version", 0), rows], separators=(",", ":")).encode()
+
+
+def write_catalog(trains, path):
+    """
+    Write the trains (as loaded from trains.json) to a catalog file
+    """
+    train_ids = sorted(trains, key=lambda t: t.encode())
+    with open(path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        records = []
+        for train_id in train_ids:
+            record = encode_train(trains[train_id])
+            records.append((f.tell(), len(record)))
+            f.write(record)
+        keys = []
+        for train_id in train_ids:
+            key = train_id.encode()
+            keys.append((f.tell(), len(key)))
+            f.write(key)
+        index_offset = f.tell()
+        for (key_offset, key_length), (record_offset, record_length) in zip(
+            keys, records
+        ):
+            f.write(
+                INDEX_ENTRY.pack(key_offset, key_length, record_offset, record_length)
+            )
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(train_ids), index_offset))
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python catalog.py TRAINS_JSON CATALOG")
+    json_path, catalog_path = sys.argv[1:]
+    with open(json_path, "r") as f:
+        trains = json.load(f)
+    write_catalog(trains, catalog_path)
+
+
+if __name__ == "__main__":
+    main()
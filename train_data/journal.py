@@ -0,0 +1,219 @@
+"""
+Durable storage for the train data service.
+
+Every change made to a train is appended to a journal, as one json line:
+
+    {"train_id": "express_2000", "version": 3, "seats": {"1A": "75bcd15", "2A": "75bcd15"}}
+
+Changes are flushed and fsync'ed in groups: while one thread waits for the
+disk, the changes made by the other threads pile up and are written by the
+next fsync - see Journal.sync().
+
+Every `snapshot_every` changes, the trains that changed are written to
+snapshot.json, and the journal starts a new segment (journal.<n>.log). Older
+segments are then deleted, so that starting the service only has to load the
+snapshot and replay the last segments.
+"""
+import json
+import os
+import threading
+
+
+SNAPSHOT_NAME = "snapshot.json"
+
+
+class Journal:
+    def __init__(self, directory, snapshot_every=1000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        # Lines written by write() but not flushed yet
+        self._pending = []
+        # Number of lines written, and number of lines known to be on disk
+        self._written = 0
+        self._flushed = 0
+        self._flushing = False
+        self._changes_since_snapshot = 0
+        self._snapshot_due = False
+        # Only one snapshot is written at a time
+        self._snapshot_lock = threading.Lock()
+        self._segment = 0
+        self._file = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, "journal.{0}.log".format(segment))
+
+    def _segments(self):
+        res = []
+        for name in os.listdir(self.directory):
+            prefix, _, rest = name.partition(".")
+            number, _, extension = rest.partition(".")
+            if prefix == "journal" and extension == "log" and number.isdigit():
+                res.append(int(number))
+        return sorted(res)
+
+    def load(self, trains):
+        """
+        Bring the trains, as loaded from trains.json, back to the state they
+        were in when the service stopped: replace them with the ones from
+        the last snapshot, then apply the changes from the journal.
+
+        Return the ids of the trains that changed.
+
+        Must be called once, before the first write()
+        """
+        changed = set()
+        first_segment = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            # Note: snapshots only contain the trains that changed
+            for train_id, train in snapshot["trains"].items():
+                trains[train_id] = train
+                changed.add(train_id)
+            first_segment = snapshot["segment"]
+
+        segments = [s for s in self._segments() if s >= first_segment]
+        for segment in segments:
+            self._replay(self._segment_path(segment), trains, changed)
+        self._segment = segments[-1] if segments else first_segment
+        self._file = open(self._segment_path(self._segment), "ab")
+        return changed
+
+    def _replay(self, path, trains, changed):
+        with open(path, "rb") as f:
+            content = f.read()
+        offset = 0
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                # The service stopped while writing this line: the change
+                # was never acknowledged, forget about it
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+            change = json.loads(line)
+            train_id = change["train_id"]
+            train = trains[train_id]
+            if change["version"] <= train["version"]:
+                # Already in the snapshot
+                continue
+            for seat_id, booking_reference in change["seats"].items():
+                train["seats"][seat_id]["booking_reference"] = booking_reference
+            train["version"] = change["version"]
+            trains[train_id] = train
+            changed.add(train_id)
+            self._changes_since_snapshot += 1
+
+    def write(self, train_id, version, seats):
+        """
+        Add a change to the journal, without waiting for it to be on
+        disk - call sync() before acknowledging it.
+
+        `seats` maps seat ids to their new booking reference.
+
+        Return True when a snapshot should be taken
+        """
+        change = {"train_id": train_id, "version": version, "seats": seats}
+        line = json.dumps(change).encode() + b"\n"
+        with self._cond:
+            self._pending.append(line)
+            self._written += 1
+            self._changes_since_snapshot += 1
+            if (
+                self._changes_since_snapshot >= self.snapshot_every
+                and not self._snapshot_due
+            ):
+                self._snapshot_due = True
+                return True
+            return False
+
+    def sync(self):
+        """
+        Wait until every change written so far is on disk
+        """
+        with self._cond:
+            self._wait_flushed(self._written)
+
+    def _wait_flushed(self, count):
+        # Note: called with self._cond held
+        while self._flushed < count:
+            if self._flushing:
+                self._cond.wait()
+                continue
+            # Flush everything that is pending, including the changes of the
+            # threads waiting for us
+            self._flushing = True
+            lines, self._pending = self._pending, []
+            written = self._written
+            self._cond.release()
+            try:
+                self._file.write(b"".join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except BaseException:
+                self._cond.acquire()
+                self._pending[:0] = lines
+                self._flushing = False
+                self._cond.notify_all()
+                raise
+            self._cond.acquire()
+            self._flushed = written
+            self._flushing = False
+            self._cond.notify_all()
+
+    def snapshot(self, serialize_trains):
+        """
+        Write a snapshot of the trains and delete the journal segments it
+        makes useless.
+
+        `serialize_trains` must return the json for all the trains that
+        changed since they were loaded, each train including every change
+        written to the journal before it is serialized
+        """
+        with self._snapshot_lock:
+            self._snapshot(serialize_trains)
+
+    def _snapshot(self, serialize_trains):
+        with self._cond:
+            self._wait_flushed(self._written)
+            while self._flushing:
+                self._cond.wait()
+            self._file.close()
+            self._segment += 1
+            segment = self._segment
+            self._file = open(self._segment_path(segment), "ab")
+            self._changes_since_snapshot = 0
+
+        try:
+            content = '{{"segment": {0}, "trains": {1}}}'.format(
+                segment, serialize_trains()
+            )
+            snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, snapshot_path)
+            self._sync_directory()
+            for old_segment in self._segments():
+                if old_segment < segment:
+                    os.remove(self._segment_path(old_segment))
+        finally:
+            with self._cond:
+                self._snapshot_due = False
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.sync()
+        with self._cond:
+            self._file.close()
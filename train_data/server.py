@@ -27,24 +27,378 @@ The "seats" field should be a json encoded list of seat ids, for example:
 
 The other two fields are ordinary strings. Note the server will prevent you from booking a seat that is already reserved with another booking reference.
 
+Each train also has a "version" number, which is incremented every time one of its seats changes. You can pass the version you based your reservation on in an optional "version" field: if the train changed since, nothing is booked and the server responds with a 409 status code and a json document like this:
+
+    {"error": "version conflict", "version": 3}
+
+To get only the seats that changed since a given version of the train, use:
+
+    http://localhost:8081/changes_since/express_2000?version=3
+
+which returns a document like this:
+
+    {"version": 5, "complete": false, "seats": {"1A": {"booking_reference": "75bcd15", "seat_number": "1", "coach": "A"}}}
+
+If the server no longer knows what changed since that version, "complete" is true and "seats" contains all the seats of the train.
+
+Add a "wait" parameter (in seconds) to do long polling: if nothing changed since the given version, the server waits for the next change (or for the delay to expire) before responding. When too many clients are already waiting, the server responds with 503 Service Unavailable instead: try again later, or without waiting.
+
+To choose seats, you often only need to know how many seats each coach has, and which are the first free ones. Use:
+
+    http://localhost:8081/occupancy/express_2000?free_seats=2
+
+which returns a document like this, with at most "free_seats" free seat numbers per coach (default: 0):
+
+    {"version": 5, "coaches": {"A": {"seat_count": 10, "booked_count": 3, "free_seat_numbers": [2, 5]}}}
+
+Clients that send "application/x-train-seats" in their Accept header get a compact binary encoding of the train instead of json, from both data_for_train and reserve (see wire_format.py). Start the server with `--gzip` to also compress the responses.
+
+Responses from data_for_train come with an ETag header. Send it back in an If-None-Match header and the server will respond with 304 Not Modified if the train did not change.
+
+For large catalogs, convert trains.json to a catalog file (see catalog.py) and start the server with `--catalog some/file`: trains are then only loaded when they are first used.
+
+By default, reservations are only kept in memory. Start the server with `--journal-dir some/directory` to keep them across restarts (see journal.py).
+
+Every endpoint responds with 404 Not Found for unknown trains, except data_for_train, which returns null.
+
 The service has one additional method, that will remove all reservations on a particular train. Use it with care:
 
     http://localhost:8081/reset/express_2000
 """
+import argparse
+import bisect
 import cherrypy
+import collections
+import contextlib
+import hashlib
 import json
+import threading
+
+from catalog import Catalog
+from journal import Journal
+from wire_format import CONTENT_TYPE, encode_train
+
+
+# Number of reservations (or resets) remembered for each train by the
+# changes_since endpoint
+CHANGE_LOG_SIZE = 1000
+
+# Maximum time changes_since can wait for a change, in seconds
+MAX_WAIT = 60
+
+# Number of threads serving requests, and maximum number of them that can
+# be waiting for changes at the same time, whatever the number of clients -
+# so that long polling never starves reservations
+THREAD_POOL = 50
+MAX_WAITERS = 20
+
+
+class LruCache(object):
+    """
+    A mapping that only keeps its `max_size` most recently used entries.
+
+    Thread safe
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
 
 
 class TrainDataService:
-    def __init__(self, json_data):
-        self.trains = json.loads(json_data)
+    """
+    Apart from the trains that changed, which are kept for good, the state
+    kept for each train (serialized bodies, occupancy) is only kept for the
+    `max_cached` most recently used trains - by default, as many as the
+    catalog keeps, if any. Locks only exist while they are used
+
+    At most `max_waiters` changes_since requests wait for changes at the
+    same time: others get a 503 response right away
+    """
+
+    def __init__(
+        self,
+        json_data=None,
+        journal=None,
+        catalog=None,
+        max_cached=None,
+        max_waiters=MAX_WAITERS,
+    ):
+        if max_cached is None:
+            max_cached = catalog.max_cached if catalog is not None else 1024
+        if catalog is not None:
+            self.trains = catalog
+        else:
+            self.trains = json.loads(json_data)
+            for train in self.trains.values():
+                train.setdefault("version", 0)
+        # Ids of the trains that changed since they were loaded - only
+        # those need to be in the snapshots of the journal
+        self._changed_trains = set()
+        # When set, every change is written to the journal before being
+        # acknowledged
+        self._journal = journal
+        if journal:
+            self._changed_trains = journal.load(self.trains)
+        # One lock per train, so that reservations on different trains
+        # do not wait for each other. They are conditions so that
+        # changes_since can wait for the train to change. Each one comes
+        # with the number of threads using it, so that it can be dropped
+        # once it is no longer used - see _lock_for()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # Serialized bodies of each train, with their ETag and content type,
+        # for each encoding - rebuilt only when the train changes. Protected
+        # by the train's lock
+        self._bodies = LruCache(max_cached)
+        # For each train that changed, (version, changed seat ids) for the
+        # last changes, oldest first - protected by the train's lock
+        self._changes = {}
+        # For each train and each coach, the number of seats, the number of
+        # booked seats and the sorted list of free seat numbers - built on
+        # first use, then kept up to date by _record_change(). Protected by
+        # the train's lock
+        self._occupancy = LruCache(max_cached)
+        self._waiters = threading.BoundedSemaphore(max_waiters)
+
+    @contextlib.contextmanager
+    def _lock_for(self, train_id):
+        """
+        Hold the lock of the train, and yield it
+        """
+        with self._locks_lock:
+            entry = self._locks.get(train_id)
+            if entry is None:
+                # Note: otherwise, clients could fill self._locks with as
+                # many train ids as they want
+                if train_id not in self.trains:
+                    raise cherrypy.NotFound()
+                entry = self._locks[train_id] = [threading.Condition(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield entry[0]
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1] and train_id not in self._changed_trains:
+                    del self._locks[train_id]
+
+    def _body(self, train_id, compact=False):
+        bodies = self._bodies.get(train_id)
+        if bodies is None:
+            bodies = {}
+            self._bodies.put(train_id, bodies)
+        cached = bodies.get(compact)
+        if cached is None:
+            train = self.trains.get(train_id)
+            body = None
+            content_type = None
+            if compact and train is not None:
+                body = encode_train(train)
+                content_type = CONTENT_TYPE
+            if body is None:
+                # Note: the content type is left to CherryPy, as before
+                # the compact encoding existed
+                body = json.dumps(train)
+                content_type = None
+            digest = hashlib.sha1(body if content_type else body.encode())
+            etag = '"{0}"'.format(digest.hexdigest())
+            cached = bodies[compact] = (body, etag, content_type)
+        return cached
+
+    def _wants_compact(self):
+        return CONTENT_TYPE in cherrypy.request.headers.get("Accept", "")
+
+    def _set_body_headers(self, etag, content_type):
+        headers = cherrypy.response.headers
+        headers["ETag"] = etag
+        headers["Vary"] = "Accept"
+        if content_type:
+            headers["Content-Type"] = content_type
+
+    def _respond_with_body(self, train_id):
+        body, etag, content_type = self._body(train_id, self._wants_compact())
+        self._set_body_headers(etag, content_type)
+        return body
 
     def data_for_train(self, train_id):
-        return json.dumps(self.trains.get(train_id))
+        if train_id not in self.trains:
+            # Unknown trains have always been returned as null
+            return json.dumps(None)
+        with self._lock_for(train_id):
+            body, etag, content_type = self._body(train_id, self._wants_compact())
+        self._set_body_headers(etag, content_type)
+        if_none_match = cherrypy.request.headers.get("If-None-Match", "")
+        if etag in [t.strip() for t in if_none_match.split(",")]:
+            cherrypy.response.status = 304
+            return ""
+        return body
 
-    def reserve(self, train_id, seats, booking_reference):
-        train = self.trains.get(train_id)
+    def changes_since(self, train_id, version, wait=None):
+        version = int(version)
+        if not wait:
+            return self._changes_since(train_id, version, None)
+        if not self._waiters.acquire(blocking=False):
+            cherrypy.response.headers["Retry-After"] = "1"
+            raise cherrypy.HTTPError(503, "Too many clients waiting for changes")
+        try:
+            return self._changes_since(train_id, version, float(wait))
+        finally:
+            self._waiters.release()
+
+    def _changes_since(self, train_id, version, wait):
+        with self._lock_for(train_id) as changed:
+            if wait:
+                # Note: with a catalog, the train may be replaced by the one
+                # that changed in the meantime, so it is fetched again
+                changed.wait_for(
+                    lambda: self.trains.get(train_id)["version"] != version,
+                    timeout=min(wait, MAX_WAIT),
+                )
+            train = self.trains.get(train_id)
+            current_version = train["version"]
+            changes = self._changes.get(train_id, ())
+            oldest_known = changes[0][0] - 1 if changes else current_version
+            if oldest_known <= version <= current_version:
+                changed_seats = set()
+                for change_version, seat_ids in changes:
+                    if change_version > version:
+                        changed_seats.update(seat_ids)
+                complete = False
+            else:
+                changed_seats = train["seats"].keys()
+                complete = True
+            seats = {s: train["seats"][s] for s in changed_seats}
+            return json.dumps(
+                {"version": current_version, "complete": complete, "seats": seats}
+            )
+
+    def occupancy(self, train_id, free_seats=0):
+        free_seats = int(free_seats)
+        with self._lock_for(train_id):
+            train = self.trains.get(train_id)
+            coaches = {}
+            for coach, occupancy in sorted(self._occupancy_for(train_id).items()):
+                coaches[coach] = {
+                    "seat_count": occupancy["seat_count"],
+                    "booked_count": occupancy["booked_count"],
+                    "free_seat_numbers": occupancy["free"][:free_seats],
+                }
+            return json.dumps({"version": train["version"], "coaches": coaches})
+
+    def _occupancy_for(self, train_id):
+        occupancy = self._occupancy.get(train_id)
+        if occupancy is None:
+            occupancy = {}
+            self._occupancy.put(train_id, occupancy)
+            for seat in self.trains.get(train_id)["seats"].values():
+                coach = occupancy.setdefault(
+                    seat["coach"], {"seat_count": 0, "booked_count": 0, "free": []}
+                )
+                coach["seat_count"] += 1
+                if seat["booking_reference"]:
+                    coach["booked_count"] += 1
+                else:
+                    coach["free"].append(int(seat["seat_number"]))
+            for coach in occupancy.values():
+                coach["free"].sort()
+        return occupancy
+
+    def _update_occupancy(self, train_id, seat_ids):
+        occupancy = self._occupancy.get(train_id)
+        if occupancy is None:
+            return
+        seats = self.trains.get(train_id)["seats"]
+        for seat_id in seat_ids:
+            seat = seats[seat_id]
+            coach = occupancy[seat["coach"]]
+            free = coach["free"]
+            number = int(seat["seat_number"])
+            index = bisect.bisect_left(free, number)
+            was_free = index < len(free) and free[index] == number
+            if seat["booking_reference"] and was_free:
+                del free[index]
+                coach["booked_count"] += 1
+            elif not seat["booking_reference"] and not was_free:
+                free.insert(index, number)
+                coach["booked_count"] -= 1
+
+    def _record_change(self, train_id, train, seat_ids):
+        # Note: `train` must be the one that was just changed - with a
+        # catalog, getting it again may decode a fresh copy if it was evicted
+        # from the cache in the meantime. Storing it keeps it in memory for good
+        self.trains[train_id] = train
+        train["version"] += 1
+        self._changed_trains.add(train_id)
+        if self._journal:
+            seats = {s: train["seats"][s]["booking_reference"] for s in seat_ids}
+            snapshot_due = self._journal.write(train_id, train["version"], seats)
+            if snapshot_due:
+                threading.Thread(target=self._snapshot, daemon=True).start()
+        changes = self._changes.get(train_id)
+        if changes is None:
+            changes = collections.deque(maxlen=CHANGE_LOG_SIZE)
+            self._changes[train_id] = changes
+        changes.append((train["version"], seat_ids))
+        self._bodies.pop(train_id)
+        self._update_occupancy(train_id, seat_ids)
+        # Note: the caller holds the lock, so it exists
+        self._locks[train_id][0].notify_all()
+
+    def _snapshot(self):
+        self._journal.snapshot(self._serialize_trains)
+
+    def _serialize_trains(self):
+        parts = []
+        for train_id in sorted(self._changed_trains):
+            with self._lock_for(train_id):
+                body = self._body(train_id)[0]
+            parts.append("{0}: {1}".format(json.dumps(train_id), body))
+        return "{" + ", ".join(parts) + "}"
+
+    def _sync(self):
+        # Note: called once the train's lock is released, so that other
+        # changes can be written to the journal in the meantime, and
+        # flushed at the same time
+        if self._journal:
+            self._journal.sync()
+
+    def reserve(self, train_id, seats, booking_reference, version=None):
         seats = json.loads(seats)
+        with self._lock_for(train_id):
+            res = self._reserve(train_id, seats, booking_reference, version)
+        self._sync()
+        return res
+
+    def _reserve(self, train_id, seats, booking_reference, version):
+        train = self.trains.get(train_id)
+        if version is not None and int(version) != train["version"]:
+            cherrypy.response.status = 409
+            return json.dumps({"error": "version conflict", "version": train["version"]})
         for seat in seats:
             if not seat in train["seats"]:
                 return "seat not found {0}".format(seat)
@@ -53,25 +407,82 @@ class TrainDataService:
                 return "already booked with reference: {0}".format(existing_reservation)
         for seat in seats:
             train["seats"][seat]["booking_reference"] = booking_reference
-        return self.data_for_train(train_id)
+        self._record_change(train_id, train, seats)
+        return self._respond_with_body(train_id)
 
     def reset(self, train_id):
-        train = self.trains.get(train_id)
-        for seat_id, seat in train["seats"].items():
-            seat["booking_reference"] = ""
-        return self.data_for_train(train_id)
+        with self._lock_for(train_id):
+            train = self.trains.get(train_id)
+            changed = []
+            for seat_id, seat in train["seats"].items():
+                if seat["booking_reference"]:
+                    changed.append(seat_id)
+                seat["booking_reference"] = ""
+            self._record_change(train_id, train, changed)
+            res = self._respond_with_body(train_id)
+        self._sync()
+        return res
 
 
 def main():
-    with open("trains.json", "r") as f:
-        trains_data = f.read()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--gzip", action="store_true", help="compress responses"
+    )
+    parser.add_argument(
+        "--catalog", help="catalog to use instead of trains.json, see catalog.py"
+    )
+    parser.add_argument(
+        "--journal-dir", help="where to store reservations, see journal.py"
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=1000,
+        help="number of changes between two snapshots of the trains",
+    )
+    parser.add_argument(
+        "--max-waiters",
+        type=int,
+        default=MAX_WAITERS,
+        help="maximum number of clients waiting for changes at the same time",
+    )
+    args = parser.parse_args()
+    if not 0 < args.max_waiters < THREAD_POOL:
+        parser.error(f"--max-waiters must be between 1 and {THREAD_POOL - 1}")
+    journal = None
+    if args.journal_dir:
+        journal = Journal(args.journal_dir, snapshot_every=args.snapshot_every)
+
+    if args.catalog:
+        service = TrainDataService(
+            catalog=Catalog(args.catalog),
+            journal=journal,
+            max_waiters=args.max_waiters,
+        )
+    else:
+        with open("trains.json", "r") as f:
+            trains_data = f.read()
+        service = TrainDataService(
+            trains_data, journal=journal, max_waiters=args.max_waiters
+        )
     TrainDataService.data_for_train.exposed = True
     TrainDataService.reserve.exposed = True
     TrainDataService.reset.exposed = True
+    TrainDataService.changes_since.exposed = True
+    TrainDataService.occupancy.exposed = True
     cherrypy.config.update(
-        {"server.socket_port": 8081, "server.socket_host": "0.0.0.0"}
+        {
+            "server.socket_port": 8081,
+            "server.socket_host": "0.0.0.0",
+            # Long polling clients keep a thread busy while they wait, see
+            # MAX_WAITERS
+            "server.thread_pool": THREAD_POOL,
+            "tools.gzip.on": args.gzip,
+            "tools.gzip.mime_types": ["text/*", "application/json", CONTENT_TYPE],
+        }
     )
-    cherrypy.quickstart(TrainDataService(trains_data))
+    cherrypy.quickstart(service)
 
 
 if __name__ == "__main__":
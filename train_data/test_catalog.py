@@ -0,0 +1,132 @@
+# Run with `python -m pytest` from the train_data directory
+
+import json
+
+import pytest
+
+from catalog import Catalog, write_catalog
+from journal import Journal
+from server import TrainDataService
+from test_server import make_service
+
+
+@pytest.fixture
+def trains():
+    return make_service(train_count=10).trains
+
+
+@pytest.fixture
+def catalog_path(tmp_path, trains):
+    path = tmp_path / "trains.catalog"
+    write_catalog(trains, path)
+    return path
+
+
+def test_trains_are_read_from_the_catalog(catalog_path, trains):
+    catalog = Catalog(catalog_path)
+
+    assert catalog.get("train_3") == trains["train_3"]
+    assert catalog.get("no_such_train") is None
+    assert "train_9" in catalog
+    assert sorted(catalog) == sorted(trains)
+
+
+def test_trains_keep_the_same_json_layout(catalog_path, trains):
+    catalog = Catalog(catalog_path)
+
+    assert json.dumps(catalog["train_0"]) == json.dumps(trains["train_0"])
+
+
+def test_only_the_last_used_trains_are_cached(catalog_path):
+    catalog = Catalog(catalog_path, max_cached=3)
+
+    for n in range(10):
+        catalog.get(f"train_{n}")
+
+    assert catalog.cached_count() == 3
+
+
+def test_modified_trains_stay_in_memory(catalog_path):
+    catalog = Catalog(catalog_path, max_cached=1)
+    train = catalog["train_0"]
+    train["seats"]["1A"]["booking_reference"] = "123"
+    catalog["train_0"] = train
+
+    for n in range(1, 10):
+        catalog.get(f"train_{n}")
+
+    assert catalog["train_0"]["seats"]["1A"]["booking_reference"] == "123"
+
+
+def test_not_a_catalog(tmp_path):
+    path = tmp_path / "trains.json"
+    path.write_text("{}" + " " * 100)
+
+    with pytest.raises(ValueError):
+        Catalog(path)
+
+
+def test_serve_trains_from_a_catalog(catalog_path, tmp_path):
+    service = TrainDataService(
+        catalog=Catalog(catalog_path, max_cached=1),
+        journal=Journal(tmp_path / "journal"),
+    )
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    for n in range(1, 10):
+        service.data_for_train(f"train_{n}")
+
+    restarted = TrainDataService(
+        catalog=Catalog(catalog_path), journal=Journal(tmp_path / "journal")
+    )
+
+    train = json.loads(restarted.data_for_train("train_0"))
+    assert train["seats"]["1A"]["booking_reference"] == "123"
+    assert train["version"] == 1
+
+
+class EvictingCatalog(Catalog):
+    """
+    A catalog where another train is used right after each get(), like
+    another request running at the same time would
+    """
+
+    def get(self, train_id, default=None):
+        train = super().get(train_id, default)
+        super().get("train_9" if train_id != "train_9" else "train_8")
+        return train
+
+
+def test_reservations_survive_evictions(catalog_path):
+    service = TrainDataService(catalog=EvictingCatalog(catalog_path, max_cached=1))
+
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    service.reset("train_1")
+    service.reserve("train_1", json.dumps(["2A"]), "456")
+
+    train = json.loads(service.data_for_train("train_0"))
+    assert train["seats"]["1A"]["booking_reference"] == "123"
+    assert train["version"] == 1
+    train = json.loads(service.data_for_train("train_1"))
+    assert train["seats"]["2A"]["booking_reference"] == "456"
+    assert train["version"] == 2
+
+
+def test_state_is_only_kept_for_the_last_used_trains(tmp_path):
+    trains = make_service(train_count=20).trains
+    path = tmp_path / "trains.catalog"
+    write_catalog(trains, path)
+    catalog = Catalog(path, max_cached=2)
+    service = TrainDataService(catalog=catalog)
+
+    for n in range(20):
+        service.data_for_train(f"train_{n}")
+        service.occupancy(f"train_{n}")
+        service.changes_since(f"train_{n}", "0")
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+
+    assert catalog.cached_count() <= 2
+    assert len(service._bodies) <= 2
+    assert len(service._occupancy) <= 2
+    assert list(service._changes) == ["train_0"]
+    # Only the train that changed keeps its lock
+    assert list(service._locks) == ["train_0"]
@@ -0,0 +1,102 @@
+# Run with `python -m pytest` from the train_data directory
+
+import json
+import os
+
+from journal import Journal
+from server import TrainDataService
+from test_server import make_service, run_in_threads
+
+
+def trains_data():
+    return json.dumps(make_service(train_count=2).trains)
+
+
+def restart(directory, **kwargs):
+    return TrainDataService(trains_data(), journal=Journal(directory, **kwargs))
+
+
+def booking_references(service, train_id):
+    train = json.loads(service.data_for_train(train_id))
+    return {s: v["booking_reference"] for s, v in train["seats"].items()}
+
+
+def test_reservations_survive_a_restart(tmp_path):
+    service = restart(tmp_path)
+    service.reserve("train_0", json.dumps(["1A", "2A"]), "123")
+    service.reserve("train_1", json.dumps(["3A"]), "456")
+    service.reset("train_1")
+
+    restarted = restart(tmp_path)
+
+    assert booking_references(restarted, "train_0") == booking_references(
+        service, "train_0"
+    )
+    assert booking_references(restarted, "train_1") == booking_references(
+        service, "train_1"
+    )
+    assert restarted.trains["train_0"]["version"] == 1
+    assert restarted.trains["train_1"]["version"] == 2
+
+
+def test_snapshots_replace_old_journal_segments(tmp_path):
+    service = restart(tmp_path)
+    for n in range(1, 13):
+        service.reserve("train_0", json.dumps([f"{n}A"]), str(n))
+    service._snapshot()
+
+    restarted = restart(tmp_path)
+
+    assert sorted(os.listdir(tmp_path)) == ["journal.1.log", "snapshot.json"]
+    assert restarted.trains["train_0"]["version"] == 12
+    assert booking_references(restarted, "train_0")["12A"] == "12"
+
+
+def test_snapshots_are_due_after_enough_changes(tmp_path):
+    journal = Journal(tmp_path, snapshot_every=3)
+    journal.load({})
+
+    due = [journal.write("train_0", n, {}) for n in range(1, 6)]
+
+    assert due == [False, False, True, False, False]
+
+
+def test_changes_after_a_snapshot_are_replayed(tmp_path):
+    service = restart(tmp_path)
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    service._snapshot()
+    service.reserve("train_0", json.dumps(["2A"]), "456")
+
+    restarted = restart(tmp_path)
+
+    references = booking_references(restarted, "train_0")
+    assert references["1A"] == "123"
+    assert references["2A"] == "456"
+    assert restarted.trains["train_0"]["version"] == 2
+
+
+def test_partially_written_changes_are_ignored(tmp_path):
+    service = restart(tmp_path)
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    with open(tmp_path / "journal.0.log", "ab") as f:
+        f.write(b'{"train_id": "train_0", "vers')
+
+    restarted = restart(tmp_path)
+    restarted.reserve("train_0", json.dumps(["2A"]), "456")
+    restarted_again = restart(tmp_path)
+
+    assert restarted_again.trains["train_0"]["version"] == 2
+    assert booking_references(restarted_again, "train_0")["2A"] == "456"
+
+
+def test_concurrent_changes_are_all_written(tmp_path):
+    service = restart(tmp_path)
+
+    def book(n):
+        service.reserve(f"train_{n % 2}", json.dumps([f"{n // 2 + 1}A"]), str(n))
+
+    run_in_threads([lambda n=n: book(n) for n in range(32)])
+
+    restarted = restart(tmp_path)
+    assert restarted.trains["train_0"]["version"] == 16
+    assert restarted.trains["train_1"]["version"] == 16
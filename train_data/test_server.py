@@ -0,0 +1,252 @@
+# Run with `python -m pytest` from the train_data directory
+
+import json
+import random
+import threading
+import time
+
+import cherrypy
+import pytest
+
+from server import TrainDataService
+
+
+def make_service(train_count=1, seat_count=16, **kwargs):
+    trains = {}
+    for i in range(train_count):
+        seats = {}
+        for n in range(1, seat_count + 1):
+            seats[f"{n}A"] = {
+                "coach": "A",
+                "seat_number": str(n),
+                "booking_reference": "",
+            }
+        trains[f"train_{i}"] = {"seats": seats}
+    return TrainDataService(json.dumps(trains), **kwargs)
+
+
+def run_in_threads(functions):
+    threads = [threading.Thread(target=f) for f in functions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_reservations_never_double_book():
+    service = make_service(seat_count=16)
+    successful = {}
+    thread_count = 32
+    attempts_per_thread = 50
+
+    def book(thread_index):
+        rng = random.Random(thread_index)
+        for attempt in range(attempts_per_thread):
+            booking_reference = f"{thread_index}-{attempt}"
+            seats = rng.sample([f"{n}A" for n in range(1, 17)], 2)
+            response = service.reserve("train_0", json.dumps(seats), booking_reference)
+            if response.startswith("{"):
+                successful[booking_reference] = seats
+
+    run_in_threads([lambda i=i: book(i) for i in range(thread_count)])
+
+    train = json.loads(service.data_for_train("train_0"))
+    for booking_reference, seats in successful.items():
+        for seat in seats:
+            assert train["seats"][seat]["booking_reference"] == booking_reference
+    booked = [s for s in train["seats"].values() if s["booking_reference"]]
+    assert len(booked) == 2 * len(successful)
+    assert train["version"] == len(successful)
+
+
+def test_reservations_on_other_trains_are_not_blocked():
+    service = make_service(train_count=2)
+    done = threading.Event()
+
+    def book_other_train():
+        service.reserve("train_1", json.dumps(["1A"]), "123")
+        done.set()
+
+    with service._lock_for("train_0"):
+        thread = threading.Thread(target=book_other_train)
+        thread.start()
+        assert done.wait(timeout=5)
+    thread.join()
+
+
+def test_reservations_on_many_trains():
+    train_count = 8
+    service = make_service(train_count=train_count, seat_count=64)
+
+    def book_all_seats(train_id):
+        for n in range(1, 65):
+            service.reserve(train_id, json.dumps([f"{n}A"]), train_id)
+
+    run_in_threads(
+        [lambda i=i: book_all_seats(f"train_{i}") for i in range(train_count)]
+    )
+
+    for i in range(train_count):
+        train = json.loads(service.data_for_train(f"train_{i}"))
+        assert train["version"] == 64
+        for seat in train["seats"].values():
+            assert seat["booking_reference"] == f"train_{i}"
+
+
+def test_serialized_trains_are_cached_until_they_change():
+    service = make_service()
+    first = service.data_for_train("train_0")
+    first_etag = cherrypy.response.headers["ETag"]
+
+    assert service.data_for_train("train_0") is first
+
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    second = service.data_for_train("train_0")
+
+    assert second != first
+    assert json.loads(second)["seats"]["1A"]["booking_reference"] == "123"
+    assert cherrypy.response.headers["ETag"] != first_etag
+
+
+def test_not_modified_when_etag_matches():
+    service = make_service()
+    service.data_for_train("train_0")
+    etag = cherrypy.response.headers["ETag"]
+
+    cherrypy.request.headers["If-None-Match"] = etag
+    try:
+        assert service.data_for_train("train_0") == ""
+        assert cherrypy.response.status == 304
+    finally:
+        del cherrypy.request.headers["If-None-Match"]
+        cherrypy.response.status = None
+
+
+def test_changes_since():
+    service = make_service()
+    service.reserve("train_0", json.dumps(["1A", "2A"]), "123")
+    service.reserve("train_0", json.dumps(["3A"]), "456")
+
+    changes = json.loads(service.changes_since("train_0", "1"))
+    assert changes["version"] == 2
+    assert not changes["complete"]
+    assert list(changes["seats"]) == ["3A"]
+    assert changes["seats"]["3A"]["booking_reference"] == "456"
+
+    changes = json.loads(service.changes_since("train_0", "0"))
+    assert sorted(changes["seats"]) == ["1A", "2A", "3A"]
+
+    changes = json.loads(service.changes_since("train_0", "2"))
+    assert changes["seats"] == {}
+
+
+def test_changes_since_unknown_version():
+    service = make_service()
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+
+    changes = json.loads(service.changes_since("train_0", "42"))
+
+    assert changes["complete"]
+    assert len(changes["seats"]) == 16
+
+
+def test_changes_since_reset():
+    service = make_service()
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    service.reset("train_0")
+
+    changes = json.loads(service.changes_since("train_0", "1"))
+
+    assert changes["version"] == 2
+    assert changes["seats"]["1A"]["booking_reference"] == ""
+
+
+def test_changes_since_waits_for_the_next_change():
+    service = make_service()
+    responses = []
+
+    def wait_for_changes():
+        responses.append(json.loads(service.changes_since("train_0", "0", wait="5")))
+
+    thread = threading.Thread(target=wait_for_changes)
+    thread.start()
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    thread.join()
+
+    (changes,) = responses
+    assert changes["version"] == 1
+    assert list(changes["seats"]) == ["1A"]
+
+
+def test_changes_since_stops_waiting_after_the_delay():
+    service = make_service()
+
+    changes = json.loads(service.changes_since("train_0", "0", wait="0.01"))
+
+    assert changes["version"] == 0
+    assert changes["seats"] == {}
+
+
+def test_occupancy():
+    service = make_service(seat_count=16)
+    service.reserve("train_0", json.dumps(["1A", "3A"]), "123")
+
+    occupancy = json.loads(service.occupancy("train_0", free_seats="3"))
+
+    assert occupancy == {
+        "version": 1,
+        "coaches": {
+            "A": {"seat_count": 16, "booked_count": 2, "free_seat_numbers": [2, 4, 5]}
+        },
+    }
+
+
+def test_occupancy_is_kept_up_to_date():
+    service = make_service(seat_count=16)
+    service.occupancy("train_0")
+
+    service.reserve("train_0", json.dumps(["2A", "1A"]), "123")
+    service.reserve("train_0", json.dumps(["2A", "3A"]), "123")
+    after_reservations = json.loads(service.occupancy("train_0", free_seats="1"))
+    service.reset("train_0")
+    after_reset = json.loads(service.occupancy("train_0", free_seats="1"))
+
+    assert after_reservations["coaches"]["A"]["booked_count"] == 3
+    assert after_reservations["coaches"]["A"]["free_seat_numbers"] == [4]
+    assert after_reset["coaches"]["A"]["booked_count"] == 0
+    assert after_reset["coaches"]["A"]["free_seat_numbers"] == [1]
+
+
+def test_unknown_trains():
+    service = make_service()
+
+    assert service.data_for_train("no_such_train") == "null"
+    with pytest.raises(cherrypy.NotFound):
+        service.reserve("no_such_train", json.dumps(["1A"]), "123")
+    with pytest.raises(cherrypy.NotFound):
+        service.changes_since("no_such_train", "0")
+    assert service._locks == {}
+    assert len(service._bodies) == 0
+
+
+def test_number_of_waiting_clients_is_limited():
+    service = make_service(max_waiters=1)
+    responses = []
+
+    def wait_for_changes():
+        responses.append(json.loads(service.changes_since("train_0", "0", wait="5")))
+
+    thread = threading.Thread(target=wait_for_changes)
+    thread.start()
+    while service._waiters._value:
+        time.sleep(0.001)
+    with pytest.raises(cherrypy.HTTPError) as error:
+        service.changes_since("train_0", "0", wait="5")
+    not_waiting = json.loads(service.changes_since("train_0", "0"))
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+    thread.join()
+
+    assert error.value.status == 503
+    assert not_waiting["version"] == 0
+    assert responses[0]["version"] == 1
+    assert service._waiters._value == 1
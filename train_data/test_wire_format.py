@@ -0,0 +1,65 @@
+# Run with `python -m pytest` from the train_data directory
+
+import json
+import struct
+
+import cherrypy
+
+from test_server import make_service
+from wire_format import CONTENT_TYPE, NO_SEAT, encode_train
+
+
+def test_encode_train():
+    train = {
+        "version": 3,
+        "seats": {
+            "1A": {"coach": "A", "seat_number": "1", "booking_reference": "abc"},
+            "3A": {"coach": "A", "seat_number": "3", "booking_reference": ""},
+            "1B": {"coach": "B", "seat_number": "1", "booking_reference": "abc"},
+        },
+    }
+
+    encoded = encode_train(train)
+
+    assert encoded == b"".join(
+        [
+            b"TRS1",
+            struct.pack("<II", 3, 1),
+            struct.pack("<H", 3) + b"abc",
+            struct.pack("<H", 2),
+            struct.pack("<H", 1) + b"A",
+            struct.pack("<5H", 4, NO_SEAT, 1, NO_SEAT, 0),
+            struct.pack("<H", 1) + b"B",
+            struct.pack("<3H", 2, NO_SEAT, 1),
+        ]
+    )
+
+
+def test_unusual_seat_ids_cannot_be_encoded():
+    train = {
+        "version": 0,
+        "seats": {
+            "A1": {"coach": "A", "seat_number": "1", "booking_reference": ""},
+        },
+    }
+
+    assert encode_train(train) is None
+
+
+def test_compact_train_data_when_accepted():
+    service = make_service()
+    service.reserve("train_0", json.dumps(["1A"]), "123")
+
+    cherrypy.request.headers["Accept"] = CONTENT_TYPE
+    try:
+        body = service.data_for_train("train_0")
+        compact_etag = cherrypy.response.headers["ETag"]
+        assert cherrypy.response.headers["Content-Type"] == CONTENT_TYPE
+    finally:
+        del cherrypy.request.headers["Accept"]
+        del cherrypy.response.headers["Content-Type"]
+    json_body = service.data_for_train("train_0")
+
+    assert body == encode_train(service.trains["train_0"])
+    assert json.loads(json_body)["seats"]["1A"]["booking_reference"] == "123"
+    assert cherrypy.response.headers["ETag"] != compact_etag
@@ -0,0 +1,69 @@
+"""
+Compact binary encoding of a train, sent instead of json to clients that
+accept the CONTENT_TYPE media type.
+
+All integers are unsigned and little-endian:
+
+    b"TRS1", train version (u32)
+    reference count (u32), then for each booking reference: length (u16), utf-8 bytes
+    coach count (u16), then for each coach:
+        coach id length (u16), utf-8 bytes
+        slot count (u16), then one u16 slot per seat number, starting at 0:
+            0xFFFF if there is no seat with this number in the coach,
+            0 if the seat is free,
+            i if the seat is booked with the i-th booking reference (starting at 1)
+
+Slots match the in-memory layout of the ticket office's CompactTrain, and
+compress very well when the response is gzipped.
+
+Only trains where every seat id is the seat number followed by the coach
+(like "12A") can be encoded this way.
+"""
+import struct
+
+
+CONTENT_TYPE = "application/x-train-seats"
+MAGIC = b"TRS1"
+NO_SEAT = 0xFFFF
+FREE = 0
+
+
+def encode_train(train):
+    """
+    Return the compact encoding of the train, or None if it cannot be
+    encoded
+    """
+    references = {}
+    coaches = {}
+    for seat_id, seat in train["seats"].items():
+        coach = seat["coach"]
+        seat_number = seat["seat_number"]
+        if seat_id != seat_number + coach or not seat_number.isdigit():
+            return None
+        number = int(seat_number)
+        if number >= NO_SEAT:
+            return None
+        slots = coaches.setdefault(coach, [])
+        if len(slots) <= number:
+            slots.extend([NO_SEAT] * (number + 1 - len(slots)))
+        booking_reference = seat["booking_reference"]
+        if booking_reference:
+            slot = references.setdefault(booking_reference, len(references) + 1)
+        else:
+            slot = FREE
+        slots[number] = slot
+    if len(references) >= NO_SEAT or len(coaches) > 0xFFFF:
+        return None
+
+    parts = [MAGIC, struct.pack("<II", train["version"], len(references))]
+    for booking_reference in references:
+        encoded = booking_reference.encode()
+        parts.append(struct.pack("<H", len(encoded)))
+        parts.append(encoded)
+    parts.append(struct.pack("<H", len(coaches)))
+    for coach, slots in coaches.items():
+        encoded = coach.encode()
+        parts.append(struct.pack("<H", len(encoded)))
+        parts.append(encoded)
+        parts.append(struct.pack("<H{0}H".format(len(slots)), len(slots), *slots))
+    return b"".join(parts)